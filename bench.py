@@ -0,0 +1,336 @@
+"""
+Per-route latency benchmark.
+
+Builds the app on a scratch SQLite database (or --db), fills it with synthetic data from
+controllers/seed.py and drives the routes through the Flask test client: every page and
+report, the chart images, the score export, /admin/metrics, the JSON quiz API, login,
+logout and quiz submission. Register and the admin edits (add/edit/delete, question import,
+quiz sampling) are not driven, replaying them would change the data the other routes
+read. For each route it reports p50/p95/p99 latency, the number of SQL statements per request and the peak Python
+memory allocated while handling one request. It then starts --startup-runs fresh
+interpreters on the same database and times importing main, create_app() and the first
+request of a few routes in each (the first run also compiles the templates). Results can be
+saved and compared against a stored baseline:
+
+    python bench.py --output bench_baseline.json
+    python bench.py --baseline bench_baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def bytecode_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'jinja_cache')
+
+
+def app_config(db_path, db_mode):
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'DB_MODE': db_mode,
+        'TESTING': True,
+        # one client replays every route as fast as it can, the rate limits would refuse it
+        'ADMISSION_CONTROL': False,
+        # next to the database, so the startup runs can begin without compiled templates
+        'JINJA_BYTECODE_CACHE_DIR': bytecode_dir(db_path),
+    }
+
+
+def build_app(db_path, db_mode):
+    from main import create_app
+    from controllers import migrations
+    app = create_app(app_config(db_path, db_mode))
+    with app.app_context():
+        migrations.initialize('Admin123')
+    return app
+
+
+def prepare(app, volumes, random_seed):
+    """Seeds the data and adds one quiz nobody attempted yet, for the take/submit routes."""
+    from controllers.database import db
+    from controllers.models import User, Subject, Chapter, Quiz, Question
+    from controllers import seed, search, catalog, answer_keys
+    from datetime import datetime, timedelta
+    with app.app_context():
+        counts = seed.seed(random_seed=random_seed, **volumes)
+        chapter = Chapter.query.join(Subject).filter(Subject.name.like(f"Subject {counts['tag']}%")).first()
+        quiz = Quiz(chapter_id=chapter.id, date_of_quiz=datetime.now() + timedelta(days=1),
+                    time_duration='00:30', remarks='benchmark quiz')
+        db.session.add(quiz)
+        db.session.flush()
+        questions = [Question(quiz_id=quiz.id, question_statement=f'Benchmark question {n}?',
+                              option1='a', option2='b', option3='c', option4='d', correct_option=1)
+                     for n in range(volumes['questions_per_quiz'])]
+        db.session.add_all(questions)
+        db.session.flush()
+        catalog.invalidate()
+        db.session.commit()
+        search.rebuild_index()
+        users = [u.id for u in User.query.filter(User.username.like(f"seed_{counts['tag']}_%")).order_by(User.id)]
+        admin = User.query.filter_by(username='admin').first().id
+        some_quiz = Quiz.query.filter(Quiz.id != quiz.id).first().id
+        return {
+            'counts': counts, 'users': users, 'admin': admin,
+            'subject': chapter.subject_id, 'quiz': some_quiz, 'fresh_quiz': quiz.id,
+            # what a client of the JSON API sends back for the fresh quiz
+            'fresh_version': answer_keys.question_set_of(sorted(q.id for q in questions)),
+            'fresh_answers': [1] * len(questions),
+            'username': f"seed_{counts['tag']}_0",
+        }
+
+
+def scenarios(ctx):
+    """
+    (name, role, method, path, body) per route; role None means logged out. A dict body is
+    sent as form data, a str as JSON.
+    """
+    quiz, fresh = ctx['quiz'], ctx['fresh_quiz']
+    answers = {}
+    api_answers = json.dumps({'version': ctx['fresh_version'], 'answers': ctx['fresh_answers']})
+    return [
+        ('index', None, 'GET', '/', None),
+        ('login_page', None, 'GET', '/login', None),
+        ('login_submit', None, 'POST', '/login', {'username': ctx['username'], 'password': 'Seed1234'}),
+        ('dashboard', 'Student', 'GET', '/dashboard', None),
+        ('admin_dashboard', 'Admin', 'GET', '/admin/dashboard', None),
+        ('admin_quiz_overview', 'Admin', 'GET', '/admin/quiz_overview', None),
+        ('admin_chapters', 'Admin', 'GET', f"/admin/chapters/{ctx['subject']}", None),
+        ('admin_questions', 'Admin', 'GET', f'/admin/questions/{quiz}', None),
+        ('admin_search', 'Admin', 'GET', '/admin/search?q=synthetic', None),
+        ('admin_summary', 'Admin', 'GET', '/admin/summary', None),
+        ('admin_summary_chart', 'Admin', 'GET', '/admin/summary/chart.png', None),
+        ('admin_leaderboard', 'Admin', 'GET', f'/admin/leaderboard/{quiz}', None),
+        ('admin_item_analysis', 'Admin', 'GET', f'/admin/item_analysis/{quiz}', None),
+        ('export_scores_csv', 'Admin', 'GET', '/admin/export/scores.csv', None),
+        ('admin_metrics', 'Admin', 'GET', '/admin/metrics', None),
+        ('user_dashboard', 'Student', 'GET', '/user/dashboard', None),
+        ('view_quiz', 'Student', 'GET', f'/user/quiz/view/{quiz}', None),
+        ('take_quiz', 'Student', 'GET', f'/user/quiz/start/{fresh}', None),
+        ('submit_quiz', 'Student', 'POST', f'/user/quiz/start/{fresh}', answers),
+        ('api_quiz', 'Student', 'GET', f'/api/quiz/{fresh}', None),
+        ('api_submit_quiz', 'Student', 'POST', f'/api/quiz/{fresh}/submit', api_answers),
+        ('user_scores', 'Student', 'GET', '/user/scores', None),
+        ('user_search', 'Student', 'GET', '/user/search?q=synthetic', None),
+        ('user_summary', 'Student', 'GET', '/user/summary', None),
+        ('user_summary_chart', 'Student', 'GET', '/user/summary/chart.png', None),
+        ('logout', 'Student', 'GET', '/logout', None),
+    ]
+
+
+def run(app, ctx, iterations):
+    from sqlalchemy import event
+    from controllers.database import db
+
+    statements = {'n': 0}
+    def count_statement(*args, **kwargs):
+        statements['n'] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+    if 'read_engine' in app.extensions:
+        event.listen(app.extensions['read_engine'], 'before_cursor_execute', count_statement)
+
+    # the submissions need a different student for every attempt; the first one takes the quiz page
+    submitters = iter(ctx['users'][1:])
+    results = {}
+    for name, role, method, path, body in scenarios(ctx):
+        timings, queries, statuses = [], [], set()
+        peak = 0
+        for i in range(iterations + 1):
+            client = app.test_client()
+            if role is not None:
+                if name in ('submit_quiz', 'api_submit_quiz'):
+                    user_id = next(submitters, None)
+                    if user_id is None:
+                        break
+                else:
+                    user_id = ctx['admin'] if role == 'Admin' else ctx['users'][0]
+                with client.session_transaction() as sess:
+                    sess['user_id'] = user_id
+                    sess['role'] = role
+            # the extra last round is traced for memory and not timed
+            traced = i == iterations
+            if traced:
+                tracemalloc.start()
+            statements['n'] = 0
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=body,
+                                   content_type='application/json' if isinstance(body, str) else None)
+            # a streamed body (the export) is only produced while it is read
+            response.get_data()
+            response.close()
+            elapsed = time.perf_counter() - start
+            if traced:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                timings.append(elapsed * 1000)
+                queries.append(statements['n'])
+            statuses.add(response.status_code)
+        timings.sort()
+        results[name] = {
+            'requests': len(timings),
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': max(queries) if queries else 0,
+            'peak_kib': round(peak / 1024, 1),
+        }
+    return results
+
+
+# (name, role, path) requested once each by a freshly started app
+STARTUP_ROUTES = [
+    ('index', None, '/'),
+    ('admin_quiz_overview', 'Admin', '/admin/quiz_overview'),
+    ('admin_summary_chart', 'Admin', '/admin/summary/chart.png'),
+]
+
+
+def startup_probe(db_path, db_mode, admin_id):
+    """Runs in a new interpreter (bench.py --startup-probe), prints its timings as JSON."""
+    timings = {}
+    start = time.perf_counter()
+    from main import create_app
+    timings['import_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    app = create_app(app_config(db_path, db_mode))
+    timings['create_app_ms'] = (time.perf_counter() - start) * 1000
+    for name, role, path in STARTUP_ROUTES:
+        client = app.test_client()
+        if role is not None:
+            with client.session_transaction() as sess:
+                sess['user_id'] = admin_id
+                sess['role'] = role
+        start = time.perf_counter()
+        response = client.get(path)
+        timings[f'first_{name}_ms'] = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f"{path} answered {response.status_code}")
+    print(json.dumps(timings))
+
+
+def startup(db_path, db_mode, admin_id, runs):
+    """{measure: {'first', 'p50', 'max'}} over `runs` fresh interpreters."""
+    shutil.rmtree(bytecode_dir(db_path), ignore_errors=True)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--db', db_path, '--db-mode', db_mode,
+             '--startup-probe', str(admin_id)],
+            capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.splitlines()[-1]))
+    results = {}
+    for key in samples[0]:
+        values = sorted(sample[key] for sample in samples)
+        results[key] = {
+            'first': round(samples[0][key], 3),
+            'p50': round(percentile(values, 50), 3),
+            'max': round(values[-1], 3),
+        }
+    return results
+
+
+def compare(report, baseline, threshold):
+    """Prints deltas against the baseline, returns the names of regressed routes and startup measures."""
+    regressed = []
+    for name, now in report['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            continue
+        slower = before['p95_ms'] and (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] > threshold
+        more_queries = now['queries'] > before['queries']
+        flag = ' REGRESSION' if slower or more_queries else ''
+        print(f"{name:22} p95 {before['p95_ms']:9.2f} -> {now['p95_ms']:9.2f} ms"
+              f"  queries {before['queries']:3} -> {now['queries']:3}{flag}")
+        if flag:
+            regressed.append(name)
+    for name, now in report.get('startup', {}).items():
+        before = baseline.get('startup', {}).get(name)
+        if not before:
+            continue
+        slower = before['p50'] and (now['p50'] - before['p50']) / before['p50'] > threshold
+        flag = ' REGRESSION' if slower else ''
+        print(f"startup {name:30} p50 {before['p50']:9.2f} -> {now['p50']:9.2f} ms{flag}")
+        if flag:
+            regressed.append(f'startup {name}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="SQLite file to use (default: a new scratch file)")
+    parser.add_argument('--db-mode', default='default', choices=['default', 'production'],
+                        help="DB_MODE of the app, see controllers/config.py")
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--subjects', type=int, default=10)
+    parser.add_argument('--chapters', type=int, default=5)
+    parser.add_argument('--quizzes', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--attempts', type=int, default=20)
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--baseline', help="JSON from an earlier --output run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help="allowed p95 slowdown against the baseline (default 0.20 = 20%%)")
+    parser.add_argument('--startup-runs', type=int, default=5, help="fresh app starts to time (0 = skip)")
+    parser.add_argument('--startup-probe', type=int, metavar='ADMIN_ID', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.startup_probe is not None:
+        startup_probe(args.db, args.db_mode, args.startup_probe)
+        return 0
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='quiz-bench-'), 'bench.sqlite3')
+    app = build_app(db_path, args.db_mode)
+    volumes = {
+        'users': max(args.users, 2 * args.iterations + 3), 'subjects': args.subjects,
+        'chapters_per_subject': args.chapters, 'quizzes_per_chapter': args.quizzes,
+        'questions_per_quiz': args.questions, 'attempts_per_user': args.attempts,
+    }
+    ctx = prepare(app, volumes, args.random_seed)
+    results = run(app, ctx, args.iterations)
+    startup_results = startup(db_path, args.db_mode, ctx['admin'], args.startup_runs) if args.startup_runs > 0 else {}
+
+    print(f"data: {ctx['counts']}")
+    print(f"{'route':22} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'peak KiB':>9}  status")
+    for name, r in results.items():
+        print(f"{name:22} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f}"
+              f" {r['queries']:8} {r['peak_kib']:9.1f}  {r['status']}")
+    if startup_results:
+        print(f"\n{f'startup ({args.startup_runs} runs)':30} {'first':>9} {'p50':>9} {'max':>9}")
+        for name, r in startup_results.items():
+            print(f"{name:30} {r['first']:9.2f} {r['p50']:9.2f} {r['max']:9.2f}")
+
+    report = {'data': ctx['counts'], 'volumes': volumes, 'routes': results, 'startup': startup_results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = compare(report, baseline, args.threshold)
+        if regressed:
+            print(f"regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,41 @@
-import matplotlib
-matplotlib.use('Agg')  # Non-GUI backend
-import matplotlib.pyplot as plt
-import io, base64
-from flask import render_template, request, redirect, url_for, flash, session
-from controllers.database import db
-from controllers.models import Subject, Chapter, Quiz, Question,User
+import hmac
+from flask import render_template, request, redirect, url_for, flash, session, abort, Response, stream_with_context, current_app
+from controllers.database import db, read_only
+from controllers.models import Subject, Chapter, Quiz, Question
+from controllers import reports, charts, search, loaders, answer_keys, question_import, cascade, catalog, http_cache, score_export, item_analysis, leaderboard, metrics
+from controllers.pagination import paginate, paginate_items
 
 def Admin_routes(app):
+    def sample_size_from(form):
+        # 'Questions per attempt': empty means every question; raises ValueError when invalid
+        value = form.get('sample_size', '').strip()
+        if not value:
+            return None
+        sample_size = int(value)
+        if sample_size < 1:
+            raise ValueError(value)
+        return sample_size
+
+    def attempts_chart_spec():
+        # subject-wise distinct user attempts, one GROUP BY query
+        subject_rows = reports.subject_attempt_counts()
+        return charts.bar_chart_spec(
+            [name for name, _ in subject_rows],
+            [count for _, count in subject_rows],
+            color='skyblue',
+            xlabel="Subjects",
+            ylabel="Distinct Users Attempted",
+            title="Subject-Wise Quiz Attempts",
+        )
+
     @app.route('/admin/dashboard')
+    @read_only
+    @http_cache.conditional(catalog.page_validators)
     def admin_dashboard():
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
-        sub = Subject.query.all()  # Grab all subjects
+        sub = paginate_items(catalog.get().subjects, ['id'])  # one page of subjects, from the catalog cache
         return render_template('admin_dashboard.html', subjects=sub)
 
     @app.route('/admin/add_subject', methods=['POST'])
@@ -26,6 +49,8 @@ def Admin_routes(app):
 
         new_subject = Subject(name=name, description=description)
         db.session.add(new_subject)
+        search.index_object(new_subject)
+        catalog.invalidate(subjects=[new_subject.id])
         db.session.commit()
         flash("Subject added successfully!", "success")
         return redirect(url_for('admin_dashboard'))
@@ -39,6 +64,8 @@ def Admin_routes(app):
         if request.method == 'POST':
             subject.name = request.form['name']
             subject.description = request.form.get('description', '')
+            search.index_object(subject)
+            catalog.invalidate(subjects=[subject.id])
             db.session.commit()
             flash("Subject updated successfully!", "success")
             return redirect(url_for('admin_dashboard'))
@@ -51,24 +78,21 @@ def Admin_routes(app):
             return redirect(url_for('login'))
 
         subject = Subject.query.get_or_404(subject_id)
-        if subject:
-            # Delete all chapters related to the given  subject first
-            Chapter.query.filter_by(subject_id=subject.id).delete()
-            db.session.delete(subject)
-            db.session.commit()
-        db.session.delete(subject)
+        # chapters, quizzes, questions and scores go with it, set-based in one transaction
+        counts = cascade.delete_subject(subject.id)
         db.session.commit()
-        flash("Subject deleted.", "info")
+        flash(f"Subject deleted ({cascade.describe(counts)}).", "info")
         return redirect(url_for('admin_dashboard'))
 
     @app.route('/admin/chapters/<int:subject_id>')
+    @read_only
     def admin_chapters(subject_id):
         """View and manage chapters under a specific subject."""
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
 
-        subject = Subject.query.get_or_404(subject_id)
+        subject = Subject.query.options(loaders.subject_chapters()).get_or_404(subject_id)
         return render_template('admin_chapters.html', subject=subject)
 
     @app.route('/admin/add_chapter/<int:subject_id>', methods=['POST'])
@@ -84,6 +108,8 @@ def Admin_routes(app):
 
         new_chapter = Chapter(name=chapter_name,description=chapter_description,subject_id=subject.id)
         db.session.add(new_chapter)
+        db.session.flush()
+        catalog.invalidate(subjects=[subject.id], chapters=[new_chapter.id])
         db.session.commit()
         flash("Chapter added successfully!", "success")
         return redirect(url_for('admin_chapters', subject_id=subject.id))
@@ -97,6 +123,7 @@ def Admin_routes(app):
         if request.method == 'POST':
             chapter.name = request.form['name']
             chapter.description = request.form.get('description', '')
+            catalog.invalidate(chapters=[chapter.id])
             db.session.commit()
             flash("Chapter updated successfully!", "success")
             return redirect(url_for('admin_chapters', subject_id=chapter.subject_id))
@@ -111,40 +138,34 @@ def Admin_routes(app):
 
         chapter = Chapter.query.get_or_404(chapter_id)
         subject_id = chapter.subject_id
-        db.session.delete(chapter)
+        counts = cascade.delete_chapter(chapter.id)
         db.session.commit()
-        flash("Chapter deleted.", "info")
+        flash(f"Chapter deleted ({cascade.describe(counts)}).", "info")
         return redirect(url_for('admin_chapters', subject_id=subject_id))
     
     @app.route('/admin/search')
+    @read_only
     def admin_search():
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
         
         query = request.args.get('q', '').strip()
-        results = {}
+        results = None
         if query:
-            from controllers.models import User, Subject, Quiz, Question
-            # Search Users
-            results['users'] = User.query.filter(
-                (User.username.ilike(f'%{query}%')) | 
-                (User.full_name.ilike(f'%{query}%'))
-            ).all()
-            # Search Subjects
-            results['subjects'] = Subject.query.filter(
-                Subject.name.ilike(f'%{query}%')
-            ).all()
-            # Search Quizzes (example: by remarks)
-            results['quizzes'] = Quiz.query.filter(
-                Quiz.remarks.ilike(f'%{query}%')
-            ).all()
-            # Search Questions
-            results['questions'] = Question.query.filter(
-                Question.question_statement.ilike(f'%{query}%')
-            ).all()
-        else:
-            results = None
+            # ranked FTS5 lookup, limited per section (see controllers/search.py).
+            # ?kind=...&after=... pages through a single section
+            kind = request.args.get('kind')
+            if kind in search.SOURCES:
+                found = search.search(query, [kind], after=request.args.get('after'))
+            else:
+                found = search.search(query, ['user', 'subject', 'quiz', 'question'])
+            results = {
+                'users': found.get('user'),
+                'subjects': found.get('subject'),
+                'quizzes': found.get('quiz'),
+                'questions': found.get('question'),
+            }
         return render_template('admin_search.html', query=query, results=results)
     @app.route('/quiz')
     def quiz():
@@ -152,60 +173,54 @@ def Admin_routes(app):
         return render_template('quiz.html')
 
     @app.route('/admin/summary')
+    @read_only
     def admin_summary():
         # Check if admin
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
 
-        # 1) Gather data for the chart (e.g., subject-wise distinct user attempts)
-        subjects = Subject.query.all()
-        subject_names = []
-        attempt_counts = []
-
-        for subj in subjects:
-            user_ids = set()
-            for chapter in subj.chapters:
-                for quiz in chapter.quizzes:
-                    for score in quiz.scores:
-                        user_ids.add(score.user_id)
-            subject_names.append(subj.name)
-            attempt_counts.append(len(user_ids))
-
-        # 2) Generate Matplotlib chart and save to static folder
-        plt.clf()  # Clear any existing figure
-        fig, ax = plt.subplots(figsize=(6,4))
-        ax.bar(subject_names, attempt_counts, color='skyblue')
-        ax.set_xlabel("Subjects")
-        ax.set_ylabel("Distinct Users Attempted")
-        ax.set_title("Subject-Wise Quiz Attempts")
-
-        # Save the chart as a static image (e.g., static/admin_summary.png)
-        chart_path = 'static/admin_summary.png'
-        plt.savefig(chart_path)
-        plt.close(fig)
-
-        # 3) Gather data for the table (e.g., user details: total quizzes attempted, total score)
-        user_summaries = []
-        users = User.query.filter_by(is_admin=False).all()
-        for user in users:
-            quiz_ids = set()
-            total_score = 0
-            for s in user.scores:
-                quiz_ids.add(s.quiz_id)
-                total_score += s.total_scored
-
-            user_summaries.append({
-                'username': user.username,
-                'full_name': user.full_name,
-                'total_quizzes': len(quiz_ids),
-                'total_score': total_score
-            })
-
-        # 4) Return template with both the chart and the table data
+        # 1) Table data (user details: total quizzes attempted, total score)
+        user_summaries = reports.user_score_summaries()
+
+        # 2) The chart itself is served by admin_summary_chart, the page links to it by content hash
         return render_template('admin_summary.html',
-                               chart_path=chart_path,
-                               user_summaries=user_summaries)
+                               user_summaries=user_summaries,
+                               chart_version=charts.spec_key(attempts_chart_spec()),
+                               subjects=catalog.get().subjects)
+
+    @app.route('/admin/summary/chart.png')
+    @read_only
+    def admin_summary_chart():
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+
+        return charts.chart_response(attempts_chart_spec())
+
+    @app.route('/admin/export/scores.<fmt>')
+    @read_only
+    def export_scores(fmt):
+        """Every score with user, quiz, chapter and subject as CSV or NDJSON, streamed."""
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+        if fmt not in score_export.FORMATS:
+            abort(404)
+        stmt = score_export.export_query(**score_export.filters_from_args(request.args))
+        resp = Response(stream_with_context(score_export.iter_export(fmt, stmt)),
+                        mimetype=score_export.FORMATS[fmt])
+        resp.headers['Content-Disposition'] = f'attachment; filename="scores.{fmt}"'
+        return resp
+
+    @app.route('/admin/metrics')
+    def admin_metrics():
+        """Request metrics in the Prometheus text format."""
+        token = current_app.config.get('METRICS_TOKEN')
+        scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+        if not scraper and ('user_id' not in session or session.get('role') != 'Admin'):
+            abort(403)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
     @app.route('/logout')
     def logout():
@@ -214,6 +229,8 @@ def Admin_routes(app):
         return redirect(url_for('index'))
 
     @app.route('/admin/quiz_overview')
+    @read_only
+    @http_cache.conditional(catalog.page_validators)
     def admin_quiz_overview():
         """
         Displays all subjects with their chapters and (for each chapter) lists its quizzes.
@@ -221,14 +238,15 @@ def Admin_routes(app):
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
-        subjects = Subject.query.all()
+        subjects = paginate_items(catalog.get().subjects, ['id'])
         return render_template('admin_quiz_overview.html', subjects=subjects)
 
     @app.route('/admin/add_quiz/<int:chapter_id>', methods=['POST'])
     def add_quiz(chapter_id):
         """
         Adds a new quiz under the specified chapter.
-        Expects 'date_of_quiz' (YYYY-MM-DD), 'time_duration' (HH:MM), and optional 'remarks'.
+        Expects 'date_of_quiz' (YYYY-MM-DD), 'time_duration' (HH:MM), and optional 'remarks'
+        and 'sample_size' (questions drawn per attempt).
         """
         if 'user_id' not in session or session.get('role') != 'Admin':
             flash("Access denied.", "danger")
@@ -243,13 +261,21 @@ def Admin_routes(app):
         except ValueError:
             flash("Invalid date format. Use YYYY-MM-DD.", "danger")
             return redirect(url_for('admin_quiz_overview'))
+        try:
+            sample_size = sample_size_from(request.form)
+        except ValueError:
+            flash("Questions per attempt must be a positive number.", "danger")
+            return redirect(url_for('admin_quiz_overview'))
         new_quiz = Quiz(
             chapter_id=chapter.id,
             date_of_quiz=date_of_quiz,
             time_duration=time_duration,
-            remarks=remarks
+            remarks=remarks,
+            sample_size=sample_size
         )
         db.session.add(new_quiz)
+        search.index_object(new_quiz)
+        catalog.invalidate(chapters=[chapter.id])
         db.session.commit()
         flash("Quiz added successfully!", "success")
         return redirect(url_for('admin_quiz_overview'))
@@ -263,14 +289,13 @@ def Admin_routes(app):
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
         quiz = Quiz.query.get_or_404(quiz_id)
-        for score in quiz.scores:
-            db.session.delete(score)
-        db.session.delete(quiz)
+        counts = cascade.delete_quiz(quiz.id)
         db.session.commit()
-        flash("Quiz deleted.", "info")
+        flash(f"Quiz deleted ({cascade.describe(counts)}).", "info")
         return redirect(url_for('admin_quiz_overview'))
 
     @app.route('/admin/questions/<int:quiz_id>')
+    @read_only
     def admin_questions(quiz_id):
         """
         Displays all questions for the specified quiz.
@@ -279,9 +304,52 @@ def Admin_routes(app):
             flash("Access denied.", "danger")
             return redirect(url_for('login'))
         quiz = Quiz.query.get_or_404(quiz_id)
-        questions = Question.query.filter_by(quiz_id=quiz_id).all()
+        questions = paginate(Question.query.filter_by(quiz_id=quiz_id), [Question.id])
         return render_template('admin_questions.html', quiz=quiz, questions=questions)
 
+    @app.route('/admin/quiz_sampling/<int:quiz_id>', methods=['POST'])
+    def set_quiz_sampling(quiz_id):
+        """Sets how many of the quiz's questions each attempt draws (empty = all of them)."""
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+        quiz = Quiz.query.get_or_404(quiz_id)
+        try:
+            quiz.sample_size = sample_size_from(request.form)
+        except ValueError:
+            flash("Questions per attempt must be a positive number.", "danger")
+            return redirect(url_for('admin_questions', quiz_id=quiz.id))
+        answer_keys.invalidate(quiz.id)
+        db.session.commit()
+        flash("Questions per attempt updated.", "success")
+        return redirect(url_for('admin_questions', quiz_id=quiz.id))
+
+    @app.route('/admin/leaderboard/<int:quiz_id>')
+    @read_only
+    def admin_leaderboard(quiz_id):
+        """Best attempts of a quiz and how the totals are spread."""
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+        quiz = catalog.quiz_or_404(quiz_id)
+        k = max(1, min(request.args.get('k', 10, type=int), 100))
+        return render_template('admin_leaderboard.html', quiz=quiz,
+                               top=leaderboard.top(quiz.id, k), distribution=leaderboard.distribution(quiz.id))
+
+    @app.route('/admin/item_analysis/<int:quiz_id>')
+    @read_only
+    def admin_item_analysis(quiz_id):
+        """Per-question difficulty, option choices and discrimination from the stored answers."""
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+        # every question, also of a question bank (whose cached snapshot only has the ids)
+        compiled = answer_keys.compile_quiz(quiz_id, whole=True)
+        if compiled is None:
+            abort(404)
+        analysis = item_analysis.analyse(compiled)
+        return render_template('admin_item_analysis.html', analysis=analysis)
+
     @app.route('/admin/add_question/<int:quiz_id>', methods=['POST'])
     def add_question(quiz_id):
         """
@@ -302,6 +370,9 @@ def Admin_routes(app):
         except ValueError:
             flash("Correct option must be a number (1-4).", "danger")
             return redirect(url_for('admin_questions', quiz_id=quiz.id))
+        if not 1 <= correct_option <= 4:
+            flash("Correct option must be between 1 and 4.", "danger")
+            return redirect(url_for('admin_questions', quiz_id=quiz.id))
         new_question = Question(
             quiz_id=quiz.id,
             question_statement=question_statement,
@@ -312,10 +383,37 @@ def Admin_routes(app):
             correct_option=correct_option
         )
         db.session.add(new_question)
+        search.index_object(new_question)
+        answer_keys.invalidate(quiz.id)
         db.session.commit()
         flash("Question added successfully!", "success")
         return redirect(url_for('admin_questions', quiz_id=quiz.id))
 
+    @app.route('/admin/import_questions/<int:quiz_id>', methods=['POST'])
+    def import_questions(quiz_id):
+        """
+        Bulk adds questions to the quiz from an uploaded CSV or JSONL file.
+        Expects 'file' and optional 'all_or_nothing' checkbox.
+        """
+        if 'user_id' not in session or session.get('role') != 'Admin':
+            flash("Access denied.", "danger")
+            return redirect(url_for('login'))
+        quiz = Quiz.query.get_or_404(quiz_id)
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose a CSV or JSONL file to import.", "danger")
+            return redirect(url_for('admin_questions', quiz_id=quiz.id))
+        fmt = request.form.get('format') or question_import.detect_format(upload.filename)
+        try:
+            report = question_import.import_questions(
+                quiz.id, upload.stream, fmt,
+                all_or_nothing=(request.form.get('all_or_nothing') == 'on'),
+            )
+        except UnicodeDecodeError:
+            flash("The file must be UTF-8 encoded.", "danger")
+            return redirect(url_for('admin_questions', quiz_id=quiz.id))
+        return render_template('admin_import_result.html', quiz=quiz, report=report)
+
     @app.route('/admin/edit_question/<int:question_id>', methods=['GET', 'POST'])
     def edit_question(question_id):
         if 'user_id' not in session or session.get('role') != 'Admin':
@@ -333,6 +431,11 @@ def Admin_routes(app):
             except ValueError:
                 flash("Correct option must be a number (1-4).", "danger")
                 return redirect(url_for('edit_question', question_id=question.id))
+            if not 1 <= question.correct_option <= 4:
+                flash("Correct option must be between 1 and 4.", "danger")
+                return redirect(url_for('edit_question', question_id=question.id))
+            search.index_object(question)
+            answer_keys.invalidate(question.quiz_id)
             db.session.commit()
             flash("Question updated successfully!", "success")
             return redirect(url_for('admin_questions', quiz_id=question.quiz_id))
@@ -348,7 +451,9 @@ def Admin_routes(app):
             return redirect(url_for('login'))
         question = Question.query.get_or_404(question_id)
         quiz_id = question.quiz_id
+        search.remove_entries('question', [question.id])
         db.session.delete(question)
+        answer_keys.invalidate(quiz_id)
         db.session.commit()
         flash("Question deleted.", "info")
         return redirect(url_for('admin_questions', quiz_id=quiz_id))
@@ -0,0 +1,224 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, request, session, jsonify, current_app
+from controllers import metrics
+
+# Admission control for the bursts at the start and end of an exam.
+# Every request (except static files and /admin/metrics) passes three checks before its view
+# runs, and is answered right away when one of them fails:
+# - token buckets: USER_RATE requests per second on average, bursts of USER_BURST, per
+#   logged-in user, and for login/register per username tried; requests without a session
+#   also take from a bucket per IP address, IP_RATE/IP_BURST, sized for a class of students
+#   behind one NAT address. An empty bucket means 429 Too Many Requests
+# - a global token bucket (GLOBAL_RATE, GLOBAL_BURST) for the whole process; beyond that 503
+# - a concurrency limit per route class (ADMISSION_LIMITS): at most `limit` requests of the
+#   class run at once, up to `queue` more wait for a slot for ADMISSION_QUEUE_TIMEOUT_MS,
+#   the rest get a 503. Login/register hash passwords and submissions grade and write, so
+#   they cannot crowd out the cheap pages.
+# The limits are per worker process. Both answers carry Retry-After; /api/ paths get JSON.
+
+AUTH, GRADING, REPORTS, READS = 'auth', 'grading', 'reports', 'reads'
+
+EXEMPT_ENDPOINTS = {'static', 'admin_metrics'}
+POST_CLASSES = {
+    'login': AUTH,
+    'register': AUTH,
+    'start_quiz': GRADING,
+    'api_submit_quiz': GRADING,
+}
+ENDPOINT_CLASSES = {
+    'admin_summary': REPORTS,
+    'admin_summary_chart': REPORTS,
+    'user_summary': REPORTS,
+    'user_summary_chart': REPORTS,
+    'admin_item_analysis': REPORTS,
+    'admin_leaderboard': REPORTS,
+    'export_scores': REPORTS,
+}
+MAX_BUCKETS = 10000
+
+
+def route_class(endpoint, method):
+    if method == 'POST' and endpoint in POST_CLASSES:
+        return POST_CLASSES[endpoint]
+    return ENDPOINT_CLASSES.get(endpoint, READS)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """0 when a token was taken, else the seconds until the next one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ConcurrencyLimit:
+    """A semaphore with a bounded, time-limited wait queue."""
+
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """None when admitted, else the reason ('queue_full' or 'queue_timeout')."""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return None
+            if self.waiting >= self.queue:
+                return 'queue_full'
+            self.waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # a slot freed just now may have woken this waiter, pass it on
+                        if self.active < self.limit:
+                            self._cond.notify()
+                        return 'queue_timeout'
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return None
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class Admission:
+    def __init__(self, config):
+        self.user_rate = config['USER_RATE']
+        self.user_burst = config['USER_BURST']
+        self.ip_rate = config['IP_RATE']
+        self.ip_burst = config['IP_BURST']
+        self.global_bucket = TokenBucket(config['GLOBAL_RATE'], config['GLOBAL_BURST'], time.monotonic())
+        timeout = config['ADMISSION_QUEUE_TIMEOUT_MS'] / 1000
+        self.limits = {
+            name: ConcurrencyLimit(limit, queue, timeout)
+            for name, (limit, queue) in config['ADMISSION_LIMITS'].items()
+        }
+        self.buckets = OrderedDict()  # key -> TokenBucket, least recently used first
+        self.rejected = {}  # (route class, reason) -> count
+        self._lock = threading.Lock()
+
+    def _keys(self, route_class):
+        """(key, rate, burst, reason) of the buckets the current request takes a token from."""
+        user_id = session.get('user_id')
+        if user_id is not None:
+            return [(f'user:{user_id}', self.user_rate, self.user_burst, 'user_rate')]
+        keys = [(f'ip:{request.remote_addr}', self.ip_rate, self.ip_burst, 'ip_rate')]
+        username = request.form.get('username') if route_class == AUTH else None
+        if username:
+            # password guessing is limited per account, not per (shared) address
+            keys.append((f'login:{username}', self.user_rate, self.user_burst, 'login_rate'))
+        return keys
+
+    def _take_tokens(self, keys):
+        """(status, reason, retry_after) when a bucket is empty, else None."""
+        now = time.monotonic()
+        with self._lock:
+            for key, rate, burst, reason in keys:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+                    # an evicted bucket was idle the longest, i.e. it would be (nearly) full again
+                    if len(self.buckets) > MAX_BUCKETS:
+                        self.buckets.popitem(last=False)
+                else:
+                    self.buckets.move_to_end(key)
+                wait = bucket.take(now)
+                if wait:
+                    return 429, reason, wait
+            wait = self.global_bucket.take(now)
+            if wait:
+                return 503, 'global_rate', wait
+        return None
+
+    def _reject(self, name, reason, status, retry_after):
+        with self._lock:
+            self.rejected[(name, reason)] = self.rejected.get((name, reason), 0) + 1
+        seconds = max(1, math.ceil(retry_after))
+        message = ("Too many requests, please slow down." if status == 429
+                   else "The server is busy, please try again in a few seconds.")
+        if request.path.startswith('/api/'):
+            resp = jsonify(error=message)
+        else:
+            # plain text: refusing has to stay much cheaper than serving
+            resp = current_app.response_class(message + '\n', mimetype='text/plain')
+        resp.status_code = status
+        resp.headers['Retry-After'] = str(seconds)
+        return resp
+
+    def admit(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+            return None
+        name = route_class(endpoint, request.method)
+        refused = self._take_tokens(self._keys(name))
+        if refused is not None:
+            status, reason, wait = refused
+            return self._reject(name, reason, status, wait)
+        limit = self.limits.get(name)
+        if limit is None:
+            return None
+        reason = limit.acquire()
+        if reason is not None:
+            return self._reject(name, reason, 503, limit.timeout)
+        g.admission_slot = limit
+        return None
+
+    def prometheus(self):
+        with self._lock:
+            rejected = dict(self.rejected)
+        return [
+            ('quiz_admission_active', 'gauge', "Requests running, by route class.",
+             [([('class', name)], limit.active) for name, limit in self.limits.items()]),
+            ('quiz_admission_queue_depth', 'gauge', "Requests waiting for a slot, by route class.",
+             [([('class', name)], limit.waiting) for name, limit in self.limits.items()]),
+            ('quiz_admission_admitted_total', 'counter', "Requests admitted, by route class.",
+             [([('class', name)], limit.admitted) for name, limit in self.limits.items()]),
+            ('quiz_admission_rejected_total', 'counter', "Requests refused, by route class and reason.",
+             [([('class', name), ('reason', reason)], count) for (name, reason), count in sorted(rejected.items())]),
+        ]
+
+
+def configure_admission(app):
+    """Registers the admission checks. Call after configure_metrics() so refusals are measured."""
+    if not app.config.get('ADMISSION_CONTROL'):
+        return
+    admission = app.extensions['admission'] = Admission(app.config)
+    metrics.add_source(app, admission.prometheus)
+
+    @app.before_request
+    def admit_request():
+        return admission.admit()
+
+    @app.teardown_request
+    def release_slot(exc):
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            slot.release()
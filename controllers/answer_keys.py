@@ -0,0 +1,208 @@
+import hashlib
+import hmac
+import random
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from flask import current_app, abort
+from sqlalchemy import select
+from controllers.database import db
+from controllers.models import Quiz, Chapter, Question, CacheGeneration, bump_generations
+
+# Compiled answer keys for grading.
+# A quiz is compiled once into an immutable snapshot: the question texts in a fixed order
+# (by question id) and the correct options packed into one bytes object. Grading a
+# submission is then a compare of two byte arrays, with no ORM objects loaded.
+# The admin routes call invalidate() whenever a quiz's questions change, which drops the
+# local snapshot and bumps the quiz's 'quiz:<id>' row in cache_generations in the same
+# transaction; get() compares that counter (one primary-key lookup) before using a snapshot,
+# so other worker processes recompile too. ANSWER_KEY_TTL bounds the age of a snapshot for
+# changes made outside the admin pages.
+# A quiz with a sample_size smaller than its question count is a question bank: its snapshot
+# only holds the sorted question ids (the bank), and for_attempt() draws sample_size of them
+# for a user and loads just those rows by primary key. The draw is seeded from SECRET_KEY,
+# the quiz and the user, so showing and grading an attempt pick the same questions without
+# storing anything in between, and reloading the page does not give a new draw.
+
+
+class QuestionText(namedtuple('QuestionText', 'id question_statement option1 option2 option3 option4')):
+    __slots__ = ()
+
+    def option(self, number):
+        """Text of option 1-4, '' for anything else (e.g. not answered)."""
+        if 1 <= number <= 4:
+            return self[number + 1]
+        return ''
+
+
+# questions: tuple of QuestionText, correct: bytes with the correct option (1-4) per question,
+# question_set: checksum of the question ids, stored with each attempt's answers so they
+# are only compared with the same questions.
+# For a question bank: sample_size, bank (array of all question ids) and, once drawn for an
+# attempt, question_ids (the drawn ids, packed); questions/correct then hold the drawn ones
+CompiledQuiz = namedtuple('CompiledQuiz', 'id subject_id questions correct question_set compiled_at '
+                                          'sample_size bank question_ids', defaults=(None, None, None))
+
+
+def question_set_of(question_ids):
+    return zlib.crc32(','.join(map(str, question_ids)).encode('ascii'))
+
+
+def pack_ids(question_ids):
+    """Question ids as 4 bytes each (little endian), as stored in Score.question_ids."""
+    question_ids = list(question_ids)
+    return struct.pack(f'<{len(question_ids)}I', *question_ids)
+
+
+def unpack_ids(packed):
+    return struct.unpack(f'<{len(packed) // 4}I', packed)
+
+_compiled = {}  # quiz id -> (generation, CompiledQuiz)
+_lock = threading.Lock()
+
+
+def _generation_name(quiz_id):
+    return f'quiz:{quiz_id}'
+
+
+def _correct_bytes(rows):
+    # options outside 1-4 can never be answered; 0 (as for anything not stored in a byte)
+    # is never counted by grade()
+    return bytes(row.correct_option if 0 <= row.correct_option <= 255 else 0 for row in rows)
+
+
+def compile_quiz(quiz_id, whole=False):
+    """
+    Builds the snapshot with two column-only queries (three for a question bank). None if the
+    quiz does not exist. whole=True compiles every question even of a question bank.
+    """
+    quiz_row = (
+        db.session.query(Quiz.id, Chapter.subject_id, Quiz.sample_size)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .filter(Quiz.id == quiz_id)
+        .first()
+    )
+    if quiz_row is None:
+        return None
+    if quiz_row.sample_size and not whole:
+        # only the ids, from the (quiz_id, id) index without touching the question rows
+        bank = array('q', db.session.execute(
+            select(Question.id).where(Question.quiz_id == quiz_id).order_by(Question.id)
+        ).scalars())
+        if quiz_row.sample_size < len(bank):
+            return CompiledQuiz(quiz_row.id, quiz_row.subject_id, (), b'', question_set_of(bank),
+                                time.monotonic(), quiz_row.sample_size, bank)
+    rows = (
+        db.session.query(
+            Question.id, Question.question_statement,
+            Question.option1, Question.option2, Question.option3, Question.option4,
+            Question.correct_option,
+        )
+        .filter(Question.quiz_id == quiz_id)
+        .order_by(Question.id)
+        .all()
+    )
+    questions = tuple(QuestionText(*row[:6]) for row in rows)
+    question_set = question_set_of(q.id for q in questions)
+    return CompiledQuiz(quiz_row.id, quiz_row.subject_id, questions, _correct_bytes(rows), question_set,
+                        time.monotonic())
+
+
+def draw(compiled, user_id):
+    """The question ids of user_id's attempt at a question bank, in the order shown."""
+    secret = current_app.config['SECRET_KEY']
+    if isinstance(secret, str):
+        secret = secret.encode()
+    digest = hmac.new(secret, f'quiz-draw:{compiled.id}:{user_id}'.encode(), hashlib.sha256).digest()
+    # sampling positions of a range is O(sample_size), the bank itself is never copied
+    positions = random.Random(digest).sample(range(len(compiled.bank)), compiled.sample_size)
+    return [compiled.bank[p] for p in positions]
+
+
+def for_attempt(compiled, user_id):
+    """
+    The quiz as user_id sees and is graded on it: compiled itself, or for a question bank
+    the user's draw with its question texts and answer key (one primary key lookup per question).
+    """
+    if compiled.bank is None:
+        return compiled
+    drawn = draw(compiled, user_id)
+    rows = db.session.execute(
+        select(Question.id, Question.question_statement,
+               Question.option1, Question.option2, Question.option3, Question.option4,
+               Question.correct_option)
+        .where(Question.id.in_(drawn), Question.quiz_id == compiled.id)
+    ).all()
+    by_id = {row.id: row for row in rows}
+    # a question deleted since the bank was compiled is left out
+    rows = [by_id[question_id] for question_id in drawn if question_id in by_id]
+    return compiled._replace(
+        questions=tuple(QuestionText(*row[:6]) for row in rows),
+        correct=_correct_bytes(rows),
+        question_ids=pack_ids(row.id for row in rows),
+    )
+
+
+def current_generation(quiz_id):
+    return db.session.execute(
+        select(CacheGeneration.generation).where(CacheGeneration.name == _generation_name(quiz_id))
+    ).scalar() or 0
+
+
+def get(quiz_id):
+    """
+    Returns the CompiledQuiz for quiz_id, compiling it on first use, after the TTL or when
+    the quiz was changed (by any process).
+    """
+    ttl = current_app.config.get('ANSWER_KEY_TTL', 60)
+    # read the counter first: a change committed meanwhile then only costs an extra compile
+    generation = current_generation(quiz_id)
+    cached = _compiled.get(quiz_id)
+    if cached is not None and cached[0] == generation and time.monotonic() - cached[1].compiled_at < ttl:
+        return cached[1]
+    compiled = compile_quiz(quiz_id)
+    if compiled is not None:
+        with _lock:
+            _compiled[quiz_id] = (generation, compiled)
+    return compiled
+
+
+def get_or_404(quiz_id):
+    compiled = get(quiz_id)
+    if compiled is None:
+        abort(404)
+    return compiled
+
+
+def invalidate(*quiz_ids):
+    """Call with every change to the questions or sampling of these quizzes; caller commits."""
+    if not quiz_ids:
+        return
+    bump_generations([_generation_name(i) for i in quiz_ids])
+    with _lock:
+        for quiz_id in quiz_ids:
+            _compiled.pop(quiz_id, None)
+
+
+def invalidate_all():
+    """Drops every snapshot of this process only."""
+    with _lock:
+        _compiled.clear()
+
+
+def parse_answers(compiled, form):
+    """The submitted options as bytes in question order, 0 for unanswered or invalid."""
+    answers = bytearray(len(compiled.questions))
+    for i, question in enumerate(compiled.questions):
+        value = form.get(f'question_{question.id}')
+        if value in ('1', '2', '3', '4'):
+            answers[i] = int(value)
+    return bytes(answers)
+
+
+def grade(compiled, answers):
+    """Number of correct answers; unanswered (0) is never counted, whatever the key holds."""
+    return sum(1 for answer, correct in zip(answers, compiled.correct) if answer and answer == correct)
@@ -1,7 +1,14 @@
 from flask import request, session, flash, redirect, url_for, render_template
-from werkzeug.security import check_password_hash, generate_password_hash
 from controllers.database import db
 from controllers.models import User
+from controllers import search, passwords
+
+
+def busy_response(template):
+    # hashing queue is full: answer right away instead of waiting behind the others
+    flash("The server is busy, please try again in a few seconds.", "warning")
+    return render_template(template), 503, {'Retry-After': '5'}
+
 
 def login_logic():
     if request.method == 'POST':
@@ -9,7 +16,19 @@ def login_logic():
         password = request.form.get('password')
 
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = user is not None and passwords.verify_password(user.password, password)
+        except passwords.HashingBusy:
+            return busy_response("login.html")
+        if valid and passwords.needs_rehash(user.password):
+            # stored with older hash parameters, upgrade while we have the password; when
+            # the pool is busy the upgrade waits for a later login, the login goes through
+            try:
+                user.password = passwords.hash_password(password)
+                db.session.commit()
+            except passwords.HashingBusy:
+                pass
+        if valid:
             session['user_id'] = user.id
             session['role'] = 'Admin' if user.is_admin else 'Student'
             flash("Login successful!", "success")
@@ -30,7 +49,10 @@ def register_logic():
         is_admin = (request.form.get('is_admin') == 'on')
 
         # Hash the password
-        hashed_password = generate_password_hash(raw_password)
+        try:
+            hashed_password = passwords.hash_password(raw_password)
+        except passwords.HashingBusy:
+            return busy_response("register.html")
 
         new_user = User(
             username=username,
@@ -40,6 +62,7 @@ def register_logic():
             is_admin=is_admin
         )
         db.session.add(new_user)
+        search.index_object(new_user)
         db.session.commit()
 
         flash("Account created successfully!", "success")
@@ -0,0 +1,70 @@
+from sqlalchemy import select, delete
+from controllers.database import db
+from controllers.models import Subject, Chapter, Quiz, Question, Score
+from controllers import reports, search, answer_keys, catalog, leaderboard
+
+# Deleting a subject, chapter or quiz together with everything below it.
+# Each level is removed with one DELETE ... WHERE id IN (SELECT ...) statement, so no child
+# row is ever loaded into the session, whatever the amount of history. Derived data (score
+# rollup, leaderboards, search index, answer keys, catalog cache) is cleaned up in the same
+# transaction.
+# The functions return the number of deleted rows per table; the caller commits.
+
+
+def _delete(model, condition):
+    stmt = delete(model).where(condition).execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount
+
+
+def _delete_quizzes(quiz_ids, counts, rollup=True):
+    """quiz_ids: SELECT of quiz ids. Removes the quizzes with their scores and questions."""
+    question_ids = select(Question.id).where(Question.quiz_id.in_(quiz_ids))
+    if rollup:
+        reports.remove_quizzes_from_rollup(quiz_ids)
+    leaderboard.remove_quizzes(quiz_ids)
+    search.remove_entries('question', question_ids)
+    search.remove_entries('quiz', quiz_ids)
+    counts['scores'] = _delete(Score, Score.quiz_id.in_(quiz_ids))
+    counts['questions'] = _delete(Question, Question.quiz_id.in_(quiz_ids))
+    counts['quizzes'] = _delete(Quiz, Quiz.id.in_(quiz_ids))
+
+
+def delete_quiz(quiz_id):
+    counts = {}
+    chapter_id = db.session.execute(select(Quiz.chapter_id).where(Quiz.id == quiz_id)).scalar()
+    _delete_quizzes(select(Quiz.id).where(Quiz.id == quiz_id), counts)
+    answer_keys.invalidate(quiz_id)
+    catalog.invalidate(chapters=[chapter_id])
+    return counts
+
+
+def delete_chapter(chapter_id):
+    counts = {}
+    subject_id = db.session.execute(select(Chapter.subject_id).where(Chapter.id == chapter_id)).scalar()
+    quiz_ids = select(Quiz.id).where(Quiz.chapter_id == chapter_id)
+    answer_keys.invalidate(*db.session.execute(quiz_ids).scalars())
+    _delete_quizzes(quiz_ids, counts)
+    counts['chapters'] = _delete(Chapter, Chapter.id == chapter_id)
+    catalog.invalidate(subjects=[subject_id], chapters=[chapter_id])
+    return counts
+
+
+def delete_subject(subject_id):
+    counts = {}
+    chapter_ids = select(Chapter.id).where(Chapter.subject_id == subject_id)
+    deleted_chapters = db.session.execute(chapter_ids).scalars().all()
+    # the subject's whole rollup goes at once, no need to subtract quiz by quiz
+    reports.remove_subject_from_rollup(subject_id)
+    quiz_ids = select(Quiz.id).where(Quiz.chapter_id.in_(chapter_ids))
+    answer_keys.invalidate(*db.session.execute(quiz_ids).scalars())
+    _delete_quizzes(quiz_ids, counts, rollup=False)
+    counts['chapters'] = _delete(Chapter, Chapter.subject_id == subject_id)
+    search.remove_entries('subject', [subject_id])
+    counts['subjects'] = _delete(Subject, Subject.id == subject_id)
+    catalog.invalidate(subjects=[subject_id], chapters=deleted_chapters)
+    return counts
+
+
+def describe(counts):
+    """'1 quizzes, 12 questions, ...' for the flash message."""
+    return ", ".join(f"{n} {table}" for table, n in counts.items())
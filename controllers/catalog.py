@@ -0,0 +1,182 @@
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, date
+from flask import current_app, abort, g
+from sqlalchemy import select
+from controllers.database import db
+from controllers.models import Subject, Chapter, Quiz, CacheGeneration, bump_generations
+
+# Read-through cache of the catalog (subjects -> chapters -> quizzes).
+# The dashboards and quiz pages show catalog data that only changes when an admin edits it,
+# so each process keeps one immutable snapshot of the whole tree in memory and serves those
+# pages from it. Every admin change calls invalidate(), which drops the local snapshot and
+# bumps the 'catalog' row in cache_generations in the same transaction; other worker
+# processes compare that counter (one primary-key lookup) before using their snapshot.
+# CATALOG_TTL bounds the age of a snapshot for changes made outside the admin pages.
+# Subjects and chapters also carry their own version ('subject:<id>', 'chapter:<id>' rows of
+# the same table), bumped by invalidate() when that entity or what is listed under it
+# changes; templates use them as keys for cached HTML fragments (controllers/fragments.py).
+
+GENERATION = 'catalog'
+
+
+class CatalogSubject:
+    __slots__ = ('id', 'name', 'description', 'chapters', 'version')
+
+    def __init__(self, id, name, description, version=0):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.chapters = ()
+        self.version = version
+
+
+class CatalogChapter:
+    __slots__ = ('id', 'subject_id', 'name', 'description', 'subject', 'quizzes', 'version')
+
+    def __init__(self, id, subject_id, name, description, subject, version=0):
+        self.id = id
+        self.subject_id = subject_id
+        self.name = name
+        self.description = description
+        self.subject = subject
+        self.quizzes = ()
+        self.version = version
+
+
+class CatalogQuiz:
+    __slots__ = ('id', 'chapter_id', 'date_of_quiz', 'time_duration', 'remarks', 'chapter')
+
+    def __init__(self, id, chapter_id, date_of_quiz, time_duration, remarks, chapter):
+        self.id = id
+        self.chapter_id = chapter_id
+        self.date_of_quiz = date_of_quiz
+        self.time_duration = time_duration
+        self.remarks = remarks
+        self.chapter = chapter
+
+
+class Snapshot:
+    """subjects: by id, quizzes: id -> CatalogQuiz, dated_quizzes: by (date_of_quiz, id)."""
+
+    def __init__(self, subjects, quizzes, dated_quizzes, generation):
+        self.subjects = subjects
+        self.quizzes = quizzes
+        self.dated_quizzes = dated_quizzes
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+
+    def upcoming(self, today):
+        """Quizzes dated today or later, in (date_of_quiz, id) order."""
+        start = bisect_left(self.dated_quizzes, datetime.combine(today, datetime.min.time()),
+                            key=lambda quiz: quiz.date_of_quiz)
+        return self.dated_quizzes[start:]
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def version():
+    """(generation, changed_at) of the catalog, looked up once per request."""
+    if 'catalog_version' not in g:
+        row = db.session.execute(
+            select(CacheGeneration.generation, CacheGeneration.changed_at)
+            .where(CacheGeneration.name == GENERATION)
+        ).first()
+        g.catalog_version = tuple(row) if row else (0, None)
+    return g.catalog_version
+
+
+def current_generation():
+    return version()[0]
+
+
+def page_validators(**view_args):
+    """http_cache.conditional() validators for pages that only show catalog data."""
+    generation, changed_at = version()
+    return (generation,), changed_at
+
+
+def load():
+    """Builds a Snapshot with four column-only queries."""
+    # read the counters first: a change committed meanwhile then only costs an extra reload
+    generation = current_generation()
+    versions = dict(db.session.execute(
+        select(CacheGeneration.name, CacheGeneration.generation)
+        .where(CacheGeneration.name.like('subject:%') | CacheGeneration.name.like('chapter:%'))
+    ).all())
+    subjects = {
+        row.id: CatalogSubject(row.id, row.name, row.description, versions.get(f'subject:{row.id}', 0))
+        for row in db.session.execute(
+            select(Subject.id, Subject.name, Subject.description).order_by(Subject.id))
+    }
+    chapters = {}
+    for row in db.session.execute(
+            select(Chapter.id, Chapter.subject_id, Chapter.name, Chapter.description).order_by(Chapter.id)):
+        subject = subjects.get(row.subject_id)
+        if subject is not None:
+            chapters[row.id] = CatalogChapter(row.id, row.subject_id, row.name, row.description, subject,
+                                              versions.get(f'chapter:{row.id}', 0))
+    quizzes = {}
+    for row in db.session.execute(
+            select(Quiz.id, Quiz.chapter_id, Quiz.date_of_quiz, Quiz.time_duration, Quiz.remarks).order_by(Quiz.id)):
+        chapter = chapters.get(row.chapter_id)
+        if chapter is not None:
+            quizzes[row.id] = CatalogQuiz(*row, chapter)
+
+    children = {}
+    for chapter in chapters.values():
+        children.setdefault(chapter.subject_id, []).append(chapter)
+    for subject_id, items in children.items():
+        subjects[subject_id].chapters = tuple(items)
+    children = {}
+    for quiz in quizzes.values():
+        children.setdefault(quiz.chapter_id, []).append(quiz)
+    for chapter_id, items in children.items():
+        chapters[chapter_id].quizzes = tuple(items)
+
+    dated = sorted((q for q in quizzes.values() if q.date_of_quiz is not None),
+                   key=lambda q: (q.date_of_quiz, q.id))
+    return Snapshot(tuple(subjects.values()), quizzes, dated, generation)
+
+
+def get():
+    """The current Snapshot, reloaded when it is older than CATALOG_TTL or another process changed the catalog."""
+    global _snapshot
+    snapshot = _snapshot
+    ttl = current_app.config.get('CATALOG_TTL', 300)
+    if (snapshot is not None and time.monotonic() - snapshot.loaded_at < ttl
+            and snapshot.generation == current_generation()):
+        return snapshot
+    with _lock:
+        # another thread may have reloaded it while this one waited
+        if _snapshot is not None and _snapshot is not snapshot and _snapshot.generation == current_generation():
+            return _snapshot
+        _snapshot = load()
+        return _snapshot
+
+
+def quiz_or_404(quiz_id):
+    quiz = get().quizzes.get(quiz_id)
+    if quiz is None:
+        abort(404)
+    return quiz
+
+
+def upcoming_quizzes(today=None):
+    return get().upcoming(today or date.today())
+
+
+def invalidate(subjects=(), chapters=()):
+    """
+    Call with every change to subjects, chapters or quizzes; caller commits. subjects /
+    chapters are the ids whose own listing changed (a subject's name or chapters, a chapter's
+    name or quizzes), new and deleted ones included so a reused id never meets an old version.
+    """
+    global _snapshot
+    bump_generations([GENERATION, *(f'subject:{i}' for i in subjects), *(f'chapter:{i}' for i in chapters)])
+    g.pop('catalog_version', None)
+    with _lock:
+        _snapshot = None
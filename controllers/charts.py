@@ -0,0 +1,126 @@
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, request, Response
+from controllers import metrics
+
+# Chart rendering for the summary pages.
+# A chart is described by a small "spec" dict built from the aggregated data. The PNG is
+# cached in memory under a hash of that spec, so the same data is rendered only once and
+# the browser gets a 304 while nothing changed. Pages link to the chart with that hash in
+# the URL (?v=...), and such a URL always shows the same picture, so the browser can keep it
+# without asking again. Rendering itself runs in a process pool so a slow matplotlib call
+# does not hold up the request threads.
+
+_cache = OrderedDict()  # spec hash -> png bytes, most recently used last
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def bar_chart_spec(labels, values, color, xlabel, ylabel, title):
+    return {
+        'labels': list(labels),
+        'values': list(values),
+        'color': color,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+        'title': title,
+    }
+
+
+def spec_key(spec):
+    """Content hash of a chart spec, used as cache key and ETag."""
+    raw = json.dumps(spec, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def render_bar_chart(spec):
+    """Renders a spec to PNG bytes. Runs inside the worker processes."""
+    import io
+    import matplotlib
+    matplotlib.use('Agg')  # Non-GUI backend
+    from matplotlib.figure import Figure
+
+    # a bare Figure (not pyplot) so there is no global state shared between renders
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.bar(spec['labels'], spec['values'], color=spec['color'])
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(spec['ylabel'])
+    ax.set_title(spec['title'])
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def _get_pool():
+    global _pool
+    workers = current_app.config.get('CHART_RENDER_WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # not forked: this runs in a request thread while other threads may hold locks
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _cache_get(key):
+    with _cache_lock:
+        png = _cache.get(key)
+        if png is not None:
+            _cache.move_to_end(key)
+        return png
+
+
+def _cache_put(key, png):
+    limit = current_app.config.get('CHART_CACHE_SIZE', 128)
+    with _cache_lock:
+        _cache[key] = png
+        _cache.move_to_end(key)
+        while len(_cache) > limit:
+            _cache.popitem(last=False)
+
+
+def get_png(spec, key=None):
+    """Returns the PNG for a spec, from the cache or freshly rendered."""
+    key = key or spec_key(spec)
+    png = _cache_get(key)
+    if png is None:
+        started = time.perf_counter()
+        pool = _get_pool()
+        if pool is None:
+            png = render_bar_chart(spec)
+        else:
+            timeout = current_app.config.get('CHART_RENDER_TIMEOUT', 30)
+            png = pool.submit(render_bar_chart, spec).result(timeout=timeout)
+        metrics.add_chart_time(time.perf_counter() - started)
+        _cache_put(key, png)
+    return png
+
+
+def chart_response(spec):
+    """
+    Builds the image response for a chart endpoint.
+    The ETag is the hash of the data, so a browser that already has this chart gets a 304
+    without anything being rendered.
+    """
+    key = spec_key(spec)
+    if key in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(get_png(spec, key), mimetype='image/png')
+    resp.set_etag(key)
+    # charts show per-user data: only the browser may cache them
+    resp.cache_control.private = True
+    if request.args.get('v') == key:
+        resp.cache_control.max_age = 365 * 24 * 3600
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
@@ -0,0 +1,106 @@
+import click
+from controllers import reports, search, question_import, seed, migrations, score_export, leaderboard
+
+# flask CLI commands, run as e.g. `flask --app main rebuild-rollup`
+
+def Cli_commands(app):
+    @app.cli.command('rebuild-rollup')
+    def rebuild_rollup():
+        """Recompute the user_subject_scores rollup from the scores table."""
+        count = reports.rebuild_rollup()
+        click.echo(f"Rebuilt user_subject_scores: {count} rows.")
+
+    @app.cli.command('rebuild-leaderboards')
+    def rebuild_leaderboards():
+        """Recompute the quiz_score_counts leaderboard table from the scores table."""
+        count = leaderboard.rebuild()
+        click.echo(f"Rebuilt quiz_score_counts: {count} rows.")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Recompute the FTS5 search_index table from users, subjects, quizzes and questions."""
+        count = search.rebuild_index()
+        click.echo(f"Rebuilt search_index: {count} entries.")
+
+    @app.cli.command('import-questions')
+    @click.argument('quiz_id', type=int)
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help="Defaults to the file extension.")
+    @click.option('--all-or-nothing', is_flag=True, help="Roll back the whole import if any row is invalid.")
+    @click.option('--batch-size', default=500, show_default=True)
+    def import_questions(quiz_id, path, fmt, all_or_nothing, batch_size):
+        """Bulk add questions to a quiz from a CSV or JSONL file."""
+        from controllers.models import Quiz
+        if Quiz.query.get(quiz_id) is None:
+            raise click.ClickException(f"Quiz {quiz_id} does not exist.")
+        with open(path, 'rb') as stream:
+            report = question_import.import_questions(
+                quiz_id, stream, fmt or question_import.detect_format(path),
+                all_or_nothing=all_or_nothing, batch_size=batch_size,
+            )
+        for line, message in report.errors:
+            click.echo(f"line {line}: {message}", err=True)
+        if report.rolled_back:
+            click.echo(f"{report.error_count} invalid rows, nothing imported.")
+        else:
+            click.echo(f"Imported {report.inserted} questions, skipped {report.error_count} invalid rows.")
+
+    @app.cli.command('seed-data')
+    @click.option('--users', default=200, show_default=True)
+    @click.option('--subjects', default=10, show_default=True)
+    @click.option('--chapters', 'chapters_per_subject', default=5, show_default=True, help="Per subject.")
+    @click.option('--quizzes', 'quizzes_per_chapter', default=4, show_default=True, help="Per chapter.")
+    @click.option('--questions', 'questions_per_quiz', default=10, show_default=True, help="Per quiz.")
+    @click.option('--attempts', 'attempts_per_user', default=20, show_default=True, help="Scores per user.")
+    @click.option('--random-seed', type=int, help="Makes the generated data reproducible.")
+    def seed_data(**volumes):
+        """Fill the database with synthetic users, subjects, quizzes, questions and scores."""
+        counts = seed.seed(**volumes)
+        click.echo(", ".join(f"{k}={v}" for k, v in counts.items()))
+        click.echo(f"Seeded users log in with password {seed.SEED_PASSWORD!r}.")
+
+    @app.cli.command('init-db')
+    @click.option('--admin-password', default='Admin123', show_default=True,
+                  help="Password of the admin user, if it has to be created.")
+    def init_db(admin_password):
+        """Create the tables, the search index and the admin user (once, before serving)."""
+        created = migrations.initialize(admin_password)
+        click.echo("Database initialized, admin user created." if created
+                   else "Database initialized, admin user already exists.")
+
+    @app.cli.command('db-migrate')
+    def db_migrate():
+        """Create missing tables and apply pending schema migrations to the database."""
+        applied = migrations.upgrade()
+        for version, name in applied:
+            click.echo(f"applied {version}: {name}")
+        if not applied:
+            click.echo("Database is up to date.")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """Fail if a hot query would scan a whole table (EXPLAIN QUERY PLAN)."""
+        problems = migrations.check_query_plans()
+        for name, lines in problems.items():
+            click.echo(f"{name}: {'; '.join(lines)}", err=True)
+        if problems:
+            raise click.ClickException(f"{len(problems)} hot queries do not use an index.")
+        click.echo(f"All {len(migrations.HOT_QUERIES)} hot queries use an index.")
+
+    @app.cli.command('export-scores')
+    @click.option('--format', 'fmt', type=click.Choice(sorted(score_export.FORMATS)), default='csv', show_default=True)
+    @click.option('--output', type=click.File('w', encoding='utf-8', lazy=True), default='-', help="Defaults to stdout.")
+    @click.option('--date-from', type=click.DateTime(['%Y-%m-%d']), help="First attempt day (inclusive).")
+    @click.option('--date-to', type=click.DateTime(['%Y-%m-%d']), help="Last attempt day (inclusive).")
+    @click.option('--subject-id', type=int)
+    @click.option('--quiz-id', type=int)
+    @click.option('--batch-size', default=score_export.BATCH_SIZE, show_default=True)
+    def export_scores(fmt, output, date_from, date_to, subject_id, quiz_id, batch_size):
+        """Stream every score with user, quiz, chapter and subject as CSV or NDJSON."""
+        stmt = score_export.export_query(
+            date_from=date_from.date() if date_from else None,
+            date_to=date_to.date() if date_to else None,
+            subject_id=subject_id, quiz_id=quiz_id,
+        )
+        for chunk in score_export.iter_export(fmt, stmt, batch_size):
+            output.write(chunk)
@@ -1,4 +1,86 @@
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 class Config:
-    SECRET_KEY = 'secret_key'
-    SQLALCHEMY_DATABASE_URI = "sqlite:///database.sqlite3"
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'secret_key')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', "sqlite:///database.sqlite3")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # database mode: 'default' keeps SQLite's defaults, 'production' turns on WAL, the pragmas
+    # below, a sized connection pool and a separate read-only engine for the GET-only pages
+    DB_MODE = os.environ.get('DB_MODE', 'default')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_CACHE_SIZE_KIB = _env_int('SQLITE_CACHE_SIZE_KIB', 20000)
+    SQLITE_MMAP_SIZE = _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)
+    DB_READ_POOL_SIZE = _env_int('DB_READ_POOL_SIZE', 20)
+
+    # password hashing: werkzeug method string (e.g. 'scrypt', 'pbkdf2:sha256:600000'), process
+    # pool size (0 = hash on the request thread) and how many hashes may be queued at once
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', 2)
+    PASSWORD_HASH_QUEUE_LIMIT = _env_int('PASSWORD_HASH_QUEUE_LIMIT', 32)
+    PASSWORD_HASH_TIMEOUT = 10
+
+    # write-behind queue for quiz submissions: batches are committed every
+    # SCORE_FLUSH_INTERVAL_MS or SCORE_FLUSH_BATCH rows, submitters wait up to SCORE_ACK_TIMEOUT s
+    SCORE_WRITE_BEHIND = os.environ.get('SCORE_WRITE_BEHIND', '0') == '1'
+    SCORE_FLUSH_INTERVAL_MS = _env_int('SCORE_FLUSH_INTERVAL_MS', 50)
+    SCORE_FLUSH_BATCH = _env_int('SCORE_FLUSH_BATCH', 200)
+    SCORE_ACK_TIMEOUT = 10
+
+    # request metrics at /admin/metrics (Prometheus text); also readable with
+    # 'Authorization: Bearer <METRICS_TOKEN>' when that is set. Requests slower than
+    # SLOW_REQUEST_MS are logged with their SQL (0 = off)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_REQUEST_MS = _env_int('SLOW_REQUEST_MS', 0)
+
+    # admission control (controllers/admission.py): token buckets per user (or username tried
+    # at login), per IP address (large: a whole class may share one NAT address) and for the
+    # whole process (requests per second, burst), and per route class the number of requests
+    # run at once and how many more may wait up to ADMISSION_QUEUE_TIMEOUT_MS for a slot
+    ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', '1') == '1'
+    USER_RATE = _env_int('USER_RATE', 5)
+    USER_BURST = _env_int('USER_BURST', 30)
+    IP_RATE = _env_int('IP_RATE', 100)
+    IP_BURST = _env_int('IP_BURST', 1000)
+    GLOBAL_RATE = _env_int('GLOBAL_RATE', 500)
+    GLOBAL_BURST = _env_int('GLOBAL_BURST', 1000)
+    ADMISSION_LIMITS = {
+        # route class: (concurrent, waiting)
+        'auth': (4, 32),
+        'grading': (8, 64),
+        'reports': (2, 8),
+        'reads': (32, 128),
+    }
+    ADMISSION_QUEUE_TIMEOUT_MS = _env_int('ADMISSION_QUEUE_TIMEOUT_MS', 2000)
+
+    # summary charts: in-memory LRU of rendered PNGs and the render process pool (0 = render inline)
+    CHART_CACHE_SIZE = 128
+    CHART_RENDER_WORKERS = 2
+    CHART_RENDER_TIMEOUT = 30
+    # maximum number of search results shown per section (users, subjects, ...)
+    SEARCH_RESULT_LIMIT = 20
+    # keyset pagination of the list pages, ?per_page= is capped at MAX_PER_PAGE
+    PER_PAGE = 25
+    MAX_PER_PAGE = 100
+    # responses: text bodies of at least COMPRESS_MIN_SIZE bytes are brotli/gzip compressed
+    COMPRESS_MIN_SIZE = _env_int('COMPRESS_MIN_SIZE', 1024)
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+    # seconds an in-memory catalog snapshot may be used without checking the database
+    CATALOG_TTL = 300
+    # templates: directory of the compiled-template cache (default instance/jinja_cache) and the
+    # number of rendered {% cache %} fragments kept in memory
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    FRAGMENT_CACHE_SIZE = 2048
+    # seconds a compiled answer key may be reused before it is rebuilt, for changes made
+    # outside the admin pages (those bump the quiz's cache generation)
+    ANSWER_KEY_TTL = 60
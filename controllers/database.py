@@ -1,3 +1,97 @@
+import sqlite3
+from functools import wraps
+from flask import g, current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 
-db=SQLAlchemy()
\ No newline at end of file
+
+class RoutingSession(Session):
+    """
+    Sends the queries of views marked @read_only to the read-only engine (production mode).
+    Flushes, and everything outside such a view, use the normal read/write engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_read_only'):
+            reader = current_app.extensions.get('read_engine')
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db=SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def read_only(view):
+    """Marks a GET-only view so its queries can go to the read-only engine."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_database(app):
+    """
+    Sets up the engines for app.config['DB_MODE'].
+    Called instead of db.init_app(app). In 'production' mode every SQLite connection runs in
+    WAL mode with the configured pragmas, the pool is sized from the config, and a second
+    engine with read-only connections (query_only) is created for the @read_only views.
+    """
+    config = app.config
+    production = config.get('DB_MODE') == 'production'
+    if production:
+        config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update({
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_pre_ping': True,
+        })
+    db.init_app(app)
+    if not production:
+        return
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        pragmas = [
+            "PRAGMA journal_mode=WAL",
+            f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+            f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KIB'])}",
+            f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        ]
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        path = engine.url.database
+        if not path or path == ':memory:':
+            return
+        # make sure the file exists and is in WAL mode before read-only connections open it
+        with engine.connect():
+            pass
+
+        def connect_read_only():
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            for pragma in pragmas[2:]:
+                conn.execute(pragma)
+            conn.execute("PRAGMA query_only=ON")
+            return conn
+
+        app.extensions['read_engine'] = create_engine(
+            'sqlite://',
+            creator=connect_read_only,
+            poolclass=QueuePool,
+            pool_size=config['DB_READ_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+# Template compilation and fragment caching.
+# - The compiled bytecode of every template is kept in JINJA_BYTECODE_CACHE_DIR (by default
+#   instance/jinja_cache), so a fresh worker loads templates without compiling them again.
+#   Jinja checks the source's mtime, an edited template is recompiled.
+# - {% cache key, ... %}...{% endcache %} renders its body once per key and reuses the HTML
+#   from an in-memory LRU (FRAGMENT_CACHE_SIZE entries). The key has to contain the version
+#   of everything the body shows, e.g. {% cache 'chapter', chapter.id, chapter.version %};
+#   the admin handlers bump those versions (catalog.invalidate), so a changed entity gets a
+#   new key and its old HTML simply drops out of the LRU.
+
+_fragments = OrderedDict()  # key -> Markup, most recently used last
+_lock = threading.Lock()
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # the template name is part of the key, two templates may use the same entity key
+        call = self.call_method('_cached', [nodes.Const(parser.name), nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cached(self, template_name, key, caller):
+        key = (template_name, _hashable(key))
+        with _lock:
+            html = _fragments.get(key)
+            if html is not None:
+                _fragments.move_to_end(key)
+                return html
+        html = caller()
+        limit = current_app.config.get('FRAGMENT_CACHE_SIZE', 2048)
+        with _lock:
+            _fragments[key] = html
+            while len(_fragments) > limit:
+                _fragments.popitem(last=False)
+        return html
+
+
+def clear():
+    with _lock:
+        _fragments.clear()
+
+
+def configure_templates(app):
+    """Sets up the bytecode cache and the {% cache %} tag. Call before the first render."""
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import os
+from datetime import timezone
+from functools import wraps
+from flask import request, session, make_response, current_app
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are only gzip-compressed
+    brotli = None
+
+# HTTP caching for the rendered pages and static files.
+# - Pages decorated with conditional() get an ETag (and Last-Modified when the data has a
+#   timestamp) computed from the version of the data they show, e.g. the catalog generation
+#   or the user's latest score. When the browser still has that version the view is not run
+#   at all and the answer is a 304.
+# - Text responses above COMPRESS_MIN_SIZE are compressed with brotli or gzip, whichever the
+#   client accepts (brotli only if the package is installed).
+# - url_for('static', ...) adds a content hash (?v=...) to the URL; requests carrying the
+#   current hash may be cached by the browser for a year without revalidating.
+
+COMPRESSIBLE = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml',
+}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_static_hashes = {}  # filename -> (mtime, hash)
+
+
+def _templates_tag(app):
+    """Hash of the template files, so a deploy with changed templates changes every ETag."""
+    tag = app.extensions.get('templates_tag')
+    if tag is None:
+        digest = hashlib.sha256()
+        folder = os.path.join(app.root_path, app.template_folder)
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as f:
+                    digest.update(name.encode('utf-8') + f.read())
+        tag = app.extensions['templates_tag'] = digest.hexdigest()[:16]
+    return tag
+
+
+def page_etag(parts):
+    """ETag of a page for the current user: templates, user, URL and the data version parts."""
+    app = current_app._get_current_object()
+    raw = repr((_templates_tag(app), session.get('user_id'), session.get('role'), request.full_path, parts))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def not_modified(etag, last_modified=None):
+    """True when the request already has this version (If-None-Match / If-Modified-Since)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validators):
+    """
+    Decorator for GET pages. validators(**view_args) returns (parts, last_modified): parts
+    is anything hashable that changes whenever the page's data does, last_modified a naive
+    UTC datetime or None. Anonymous requests and pages with pending flash messages are
+    always rendered.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if request.method != 'GET' or 'user_id' not in session or session.get('_flashes'):
+                return view(**kwargs)
+            parts, last_modified = validators(**kwargs)
+            etag = page_etag(parts)
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+            if not_modified(etag, last_modified):
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(view(**kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            # per-user pages: only the browser may keep them, and it has to ask every time
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+            return resp
+        return wrapper
+    return decorator
+
+
+def static_hash(filename):
+    """Short content hash of a file in the static folder, recomputed when it changes."""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = _static_hashes[filename] = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+    return cached[1]
+
+
+def _compress(resp):
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or 'Content-Encoding' in resp.headers or resp.mimetype not in COMPRESSIBLE):
+        return
+    resp.vary.add('Accept-Encoding')
+    data = resp.get_data()
+    if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', 1024):
+        return
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding, body = 'br', brotli.compress(data, quality=current_app.config.get('BROTLI_QUALITY', 5))
+    elif accepted['gzip']:
+        encoding, body = 'gzip', gzip.compress(data, compresslevel=current_app.config.get('GZIP_LEVEL', 6))
+    else:
+        return
+    resp.set_data(body)
+    resp.headers['Content-Encoding'] = encoding
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        # the bytes differ from the uncompressed version, so the validator may only be weak
+        resp.set_etag(etag, weak=True)
+
+
+def configure_http_cache(app):
+    @app.url_defaults
+    def add_static_hash(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            digest = static_hash(values.get('filename', ''))
+            if digest:
+                values['v'] = digest
+
+    @app.after_request
+    def cache_and_compress(resp):
+        if request.endpoint == 'static' and resp.status_code in (200, 304):
+            version = request.args.get('v')
+            if version and version == static_hash(request.view_args.get('filename', '')):
+                resp.cache_control.public = True
+                resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+                resp.cache_control.immutable = True
+                resp.cache_control.no_cache = None
+        _compress(resp)
+        return resp
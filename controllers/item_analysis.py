@@ -0,0 +1,111 @@
+from collections import namedtuple
+from sqlalchemy import select, func, or_
+from controllers.database import db
+from controllers.models import Score
+from controllers.answer_keys import unpack_ids
+
+# Item analysis of a quiz from the packed answers stored with each attempt.
+# All attempts made with the quiz's current questions (same answer_keys question_set) are
+# stacked into one attempts x questions uint8 matrix, and every statistic is computed from
+# it with whole-array NumPy operations:
+# - p-value: share of attempts that answered the question correctly (its easiness)
+# - options: how often each option (and "unanswered") was picked
+# - discrimination: p-value in the top 27% of attempts (by total) minus the bottom 27%
+# Attempts at a question bank carry the ids of their drawn questions, so they are placed into
+# the matrix by id (whatever questions were added since) and a mask marks the questions each
+# attempt was shown; every statistic is then taken over the attempts that saw the question,
+# and attempts are ranked by their share of correct answers instead of their total.
+
+GROUP_FRACTION = 0.27
+HARD_BELOW = 0.3
+EASY_ABOVE = 0.9
+LOW_DISCRIMINATION = 0.2
+
+# options: (count, share) for option 1-4, then unanswered
+ItemStats = namedtuple('ItemStats', 'question correct_option p_value discrimination options flags')
+Analysis = namedtuple('Analysis', 'quiz attempts other_attempts items')
+
+
+def _rates(np, hits, shown):
+    """hits / shown per question, 0 where no attempt was shown the question."""
+    return np.divide(hits, shown, out=np.zeros(hits.shape), where=shown > 0)
+
+
+def analyse(compiled):
+    """Analysis of a CompiledQuiz with every question (answer_keys.compile_quiz(whole=True)).
+    other_attempts counts attempts that cannot be used (made before the questions changed,
+    or before answers were stored)."""
+    import numpy as np  # only needed here, so it stays off the app's import path
+
+    rows = db.session.execute(
+        select(Score.answers, Score.question_ids).where(
+            Score.quiz_id == compiled.id,
+            or_(Score.question_set == compiled.question_set, Score.question_ids.is_not(None)))
+    ).all()
+    all_attempts = db.session.execute(
+        select(func.count(Score.id)).where(Score.quiz_id == compiled.id)
+    ).scalar()
+    size = len(compiled.questions)
+    if not size:
+        return Analysis(compiled, 0, all_attempts, [])
+    ids = np.array([q.id for q in compiled.questions], dtype=np.int64)  # sorted by id
+    answers = np.zeros((len(rows), size), dtype=np.uint8)
+    shown = np.zeros((len(rows), size), dtype=bool)
+    used = 0
+    for blob, packed in rows:
+        if blob is None:
+            continue
+        if packed is None:
+            if len(blob) != size:
+                continue
+            answers[used] = np.frombuffer(blob, dtype=np.uint8)
+            shown[used] = True
+        else:
+            drawn = np.array(unpack_ids(packed), dtype=np.int64)
+            if len(drawn) != len(blob):
+                continue
+            # questions deleted since the attempt are dropped
+            positions = np.searchsorted(ids, drawn).clip(0, size - 1)
+            still_there = ids[positions] == drawn
+            answers[used, positions[still_there]] = np.frombuffer(blob, dtype=np.uint8)[still_there]
+            shown[used, positions[still_there]] = True
+        used += 1
+    answers, shown = answers[:used], shown[:used]
+    if not used:
+        return Analysis(compiled, 0, all_attempts, [])
+
+    key = np.frombuffer(compiled.correct, dtype=np.uint8)
+    correct = (answers == key) & shown
+    times_shown = shown.sum(axis=0)
+    p_values = _rates(np, correct.sum(axis=0), times_shown)
+    # the share of correct answers ranks attempts that saw different numbers of questions
+    totals = _rates(np, correct.sum(axis=1), shown.sum(axis=1))
+
+    # option counts per question in one bincount: question i, option o -> bin 5 * i + o
+    picked = np.where(answers <= 4, answers, 0).astype(np.intp) + 5 * np.arange(size)
+    options = np.bincount(picked[shown], minlength=5 * size).reshape(size, 5)
+
+    group = max(1, int(round(used * GROUP_FRACTION)))
+    order = np.argsort(totals, kind='stable')
+    top, bottom = order[-group:], order[:group]
+    discrimination = (_rates(np, correct[top].sum(axis=0), shown[top].sum(axis=0))
+                      - _rates(np, correct[bottom].sum(axis=0), shown[bottom].sum(axis=0)))
+
+    items = []
+    for i, question in enumerate(compiled.questions):
+        counts = options[i].tolist()
+        right = compiled.correct[i]
+        seen = max(int(times_shown[i]), 1)
+        flags = []
+        if p_values[i] < HARD_BELOW:
+            flags.append('hard')
+        if p_values[i] > EASY_ABOVE:
+            flags.append('easy')
+        if discrimination[i] < LOW_DISCRIMINATION:
+            flags.append('low discrimination')
+        if 1 <= right <= 4 and max(counts[1:5]) > counts[right]:
+            flags.append('a wrong option is picked more often')
+        # option 1-4 first, unanswered (bin 0) last
+        shares = [(counts[o], counts[o] / seen) for o in (1, 2, 3, 4, 0)]
+        items.append(ItemStats(question, right, float(p_values[i]), float(discrimination[i]), shares, flags))
+    return Analysis(compiled, used, all_attempts - used, items)
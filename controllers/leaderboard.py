@@ -0,0 +1,126 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from itertools import accumulate
+from sqlalchemy import select, delete, func, case, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from controllers.database import db
+from controllers.models import User, Score, QuizScoreCount
+
+# Per-quiz leaderboards.
+# quiz_score_counts holds, per quiz, how many attempts ended with each total. It is updated
+# in the same transaction as every new score (one upsert), so it never needs sorting: a
+# score's rank is 1 + the attempts with a higher total, its percentile the share with a
+# lower one. Both are sums over at most (questions + 1) rows of one quiz found through the
+# primary key, whatever the number of attempts. The top K attempts are read in order from
+# the (quiz_id, total_scored) index on scores. rebuild() recomputes the table from scores.
+
+
+class Standing(namedtuple('Standing', 'rank attempts below')):
+    __slots__ = ()
+
+    @property
+    def percentile(self):
+        """Share of the attempts with a lower total, in percent."""
+        return 100.0 * self.below / self.attempts if self.attempts else 0.0
+
+
+def add_scores(rows):
+    """Counts new attempts (dicts with quiz_id and total_scored), one executemany. Caller commits."""
+    stmt = insert(QuizScoreCount).values(
+        quiz_id=bindparam('quiz_id'), total_scored=bindparam('total_scored'), attempts=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['quiz_id', 'total_scored'],
+        set_={'attempts': QuizScoreCount.attempts + 1},
+    )
+    db.session.execute(stmt, [{'quiz_id': r['quiz_id'], 'total_scored': r['total_scored']} for r in rows])
+
+
+def remove_quizzes(quiz_ids):
+    """quiz_ids: list or SELECT of quiz ids. Caller commits."""
+    stmt = delete(QuizScoreCount).where(QuizScoreCount.quiz_id.in_(quiz_ids))
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def rebuild():
+    """Recomputes quiz_score_counts from the scores table. Returns the number of rows."""
+    db.session.execute(delete(QuizScoreCount))
+    result = db.session.execute(
+        insert(QuizScoreCount).from_select(
+            ['quiz_id', 'total_scored', 'attempts'],
+            select(Score.quiz_id, Score.total_scored, func.count(Score.id))
+            .group_by(Score.quiz_id, Score.total_scored),
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def standing(quiz_id, total_scored):
+    """Standing of a total within its quiz (the attempt itself included), one query."""
+    higher, below, attempts = db.session.execute(
+        select(
+            func.coalesce(func.sum(case((QuizScoreCount.total_scored > total_scored, QuizScoreCount.attempts), else_=0)), 0),
+            func.coalesce(func.sum(case((QuizScoreCount.total_scored < total_scored, QuizScoreCount.attempts), else_=0)), 0),
+            func.coalesce(func.sum(QuizScoreCount.attempts), 0),
+        ).where(QuizScoreCount.quiz_id == quiz_id)
+    ).one()
+    return Standing(higher + 1, attempts, below)
+
+
+def _histograms(quiz_ids):
+    """quiz id -> (totals ascending, cumulative) where cumulative[i] is the number of attempts
+    with a total below totals[i] and cumulative[-1] the number of all attempts."""
+    grouped = {}
+    rows = db.session.execute(
+        select(QuizScoreCount.quiz_id, QuizScoreCount.total_scored, QuizScoreCount.attempts)
+        .where(QuizScoreCount.quiz_id.in_(quiz_ids))
+        .order_by(QuizScoreCount.quiz_id, QuizScoreCount.total_scored)
+    )
+    for quiz_id, total, attempts in rows:
+        totals, counts = grouped.setdefault(quiz_id, ([], []))
+        totals.append(total)
+        counts.append(attempts)
+    return {quiz_id: (totals, [0, *accumulate(counts)]) for quiz_id, (totals, counts) in grouped.items()}
+
+
+_EMPTY = ([], [0])
+
+
+def _standing_in(histogram, total):
+    totals, cumulative = histogram
+    attempts = cumulative[-1]
+    higher = attempts - cumulative[bisect_right(totals, total)]
+    return Standing(higher + 1, attempts, cumulative[bisect_left(totals, total)])
+
+
+def standings(pairs):
+    """{(quiz_id, total_scored): Standing} for many scores at once (a page of them), one query."""
+    pairs = list(pairs)
+    histograms = _histograms({quiz_id for quiz_id, _ in pairs})
+    return {
+        (quiz_id, total): _standing_in(histograms.get(quiz_id, _EMPTY), total)
+        for quiz_id, total in pairs
+    }
+
+
+def top(quiz_id, k=10):
+    """The k best attempts of a quiz as (rank, username, full_name, total_scored, timestamp)."""
+    rows = db.session.execute(
+        select(User.username, User.full_name, Score.total_scored, Score.timestamp)
+        .join(User, User.id == Score.user_id)
+        .where(Score.quiz_id == quiz_id)
+        .order_by(Score.total_scored.desc(), Score.id)
+        .limit(k)
+    ).all()
+    histogram = _histograms([quiz_id]).get(quiz_id, _EMPTY)
+    return [(_standing_in(histogram, row.total_scored).rank, *row) for row in rows]
+
+
+def distribution(quiz_id):
+    """(total_scored, attempts) for a quiz, best total first."""
+    return db.session.execute(
+        select(QuizScoreCount.total_scored, QuizScoreCount.attempts)
+        .where(QuizScoreCount.quiz_id == quiz_id)
+        .order_by(QuizScoreCount.total_scored.desc())
+    ).all()
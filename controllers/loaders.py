@@ -0,0 +1,35 @@
+from sqlalchemy.orm import joinedload, selectinload
+from controllers.models import Subject, Chapter, Quiz, Score
+
+# Loading plans for the pages. All relationships in models.py are lazy, so a template that
+# walks quiz.chapter.subject or subject.chapters would run one query per row. Routes pass
+# these to .options() so each page runs a small fixed number of queries instead.
+# They are functions because the backref attributes (Quiz.chapter, ...) only exist once
+# the mappers are configured.
+
+
+def quiz_chapter_subject():
+    """quiz.chapter.name and quiz.chapter.subject.name in the same SELECT (joined)."""
+    return (
+        joinedload(Quiz.chapter)
+        .load_only(Chapter.name, Chapter.subject_id)
+        .joinedload(Chapter.subject)
+        .load_only(Subject.name)
+    )
+
+
+def score_quiz_chapter_subject():
+    """score.quiz.chapter.subject for the scores table."""
+    return (
+        joinedload(Score.quiz)
+        .load_only(Quiz.chapter_id)
+        .joinedload(Quiz.chapter)
+        .load_only(Chapter.name, Chapter.subject_id)
+        .joinedload(Chapter.subject)
+        .load_only(Subject.name)
+    )
+
+
+def subject_chapters():
+    return selectinload(Subject.chapters)
+
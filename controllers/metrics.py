@@ -0,0 +1,213 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, current_app, has_request_context, has_app_context, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Per-request performance metrics.
+# configure_metrics() hooks into every request and records, per endpoint: wall time, the
+# number and total time of SQL statements (SQLAlchemy cursor events on both engines),
+# template render time and chart render time. Each value goes into a histogram with fixed
+# buckets, so memory stays the same however many requests are served. /admin/metrics prints
+# everything in the Prometheus text format. With SLOW_REQUEST_MS set, requests slower than
+# that are logged together with their SQL statements.
+# The histograms, counters and extra sources belong to the app (app.extensions['metrics']),
+# so several apps in one process, e.g. in tests, each report only their own.
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MAX_LOGGED_STATEMENTS = 100
+
+HISTOGRAMS = {
+    # name: (help, buckets, field of RequestStats)
+    'quiz_request_duration_seconds': ("Wall time of a request.", TIME_BUCKETS, 'wall'),
+    'quiz_request_sql_statements': ("SQL statements run by a request.", COUNT_BUCKETS, 'sql_count'),
+    'quiz_request_sql_seconds': ("Time spent in SQL statements by a request.", TIME_BUCKETS, 'sql_time'),
+    'quiz_request_template_seconds': ("Time spent rendering templates by a request.", TIME_BUCKETS, 'template_time'),
+    'quiz_request_chart_seconds': ("Time spent rendering charts by a request (cache misses).", TIME_BUCKETS, 'chart_time'),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ('start', 'wall', 'sql_count', 'sql_time', 'template_time', 'chart_time',
+                 'statements', '_template_start')
+
+    def __init__(self, capture_sql):
+        self.start = time.perf_counter()
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.chart_time = 0.0
+        self.statements = [] if capture_sql else None
+        self._template_start = None
+
+
+class Registry:
+    """The metrics of one app."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (metric name, endpoint) -> Histogram
+        self.requests = {}  # (endpoint, status) -> count
+        self.sources = []  # functions returning [(name, type, help, [(labels, value)])]
+
+    def record(self, endpoint, status, stats):
+        with self.lock:
+            for name, (_, buckets, field) in HISTOGRAMS.items():
+                histogram = self.histograms.get((name, endpoint))
+                if histogram is None:
+                    histogram = self.histograms[(name, endpoint)] = Histogram(buckets)
+                histogram.observe(getattr(stats, field))
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+
+def current():
+    """RequestStats of the request being served, None outside requests."""
+    if has_request_context():
+        return g.get('request_metrics')
+    return None
+
+
+def add_chart_time(seconds):
+    stats = current()
+    if stats is not None:
+        stats.chart_time += seconds
+
+
+def add_source(app, source):
+    """Registers a function whose metrics are added to app's output (e.g. the score writer)."""
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.sources.append(source)
+
+
+def _watch_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['metrics_start'].pop()
+        stats = current()
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        if stats.statements is not None and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+            stats.statements.append((elapsed, statement))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}' if labels else ''
+
+
+def render():
+    """All metrics of the current app in the Prometheus text exposition format."""
+    registry = current_app.extensions['metrics']
+    with registry.lock:
+        histograms = {key: (list(h.counts), h.sum, h.count) for key, h in registry.histograms.items()}
+        requests = dict(registry.requests)
+        sources = list(registry.sources)
+    lines = [
+        '# HELP quiz_requests_total Requests served, by endpoint and status.',
+        '# TYPE quiz_requests_total counter',
+    ]
+    for (endpoint, status), count in sorted(requests.items()):
+        lines.append(f'quiz_requests_total{_labels([("endpoint", endpoint), ("status", status)])} {count}')
+    for name, (help_text, buckets, _) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, endpoint), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, n in zip([*buckets, '+Inf'], counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels([("endpoint", endpoint), ("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels([("endpoint", endpoint)])} {total}')
+            lines.append(f'{name}_count{_labels([("endpoint", endpoint)])} {count}')
+    for source in sources:
+        for name, kind, help_text, samples in source():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def configure_metrics(app):
+    """Registers the request hooks and the SQL listeners. Call after configure_database()."""
+    registry = app.extensions['metrics'] = Registry()
+    with app.app_context():
+        from controllers.database import db
+        _watch_engine(db.engine)
+    if 'read_engine' in app.extensions:
+        _watch_engine(app.extensions['read_engine'])
+
+    slow_ms = app.config.get('SLOW_REQUEST_MS', 0)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_metrics = RequestStats(capture_sql=slow_ms > 0)
+
+    @before_render_template.connect_via(app)
+    def template_started(sender, template, context, **extra):
+        stats = current()
+        if stats is not None:
+            stats._template_start = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def template_finished(sender, template, context, **extra):
+        stats = current()
+        if stats is not None and stats._template_start is not None:
+            stats.template_time += time.perf_counter() - stats._template_start
+            stats._template_start = None
+
+    @app.after_request
+    def remember_status(resp):
+        if has_app_context() and 'request_metrics' in g:
+            g.request_metrics_status = resp.status_code
+        return resp
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        stats = g.pop('request_metrics', None)
+        if stats is None:
+            return
+        stats.wall = time.perf_counter() - stats.start
+        status = 500 if exc is not None else g.pop('request_metrics_status', 500)
+        endpoint = request.endpoint or 'none'
+        registry.record(endpoint, status, stats)
+        if slow_ms and stats.wall * 1000 >= slow_ms:
+            slowest = sorted(stats.statements, reverse=True)[:10]
+            app.logger.warning(
+                "slow request: %s %s (%s) %.1f ms, %d SQL statements in %.1f ms, templates %.1f ms, charts %.1f ms%s",
+                request.method, request.full_path, endpoint, stats.wall * 1000,
+                stats.sql_count, stats.sql_time * 1000, stats.template_time * 1000, stats.chart_time * 1000,
+                ''.join(f"\n  {seconds * 1000:.1f} ms  {' '.join(sql.split())}" for seconds, sql in slowest),
+            )
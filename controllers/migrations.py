@@ -0,0 +1,219 @@
+import re
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.security import generate_password_hash
+from controllers.database import db
+from controllers.models import User
+from controllers import search
+
+# Versioned schema migrations for existing SQLite files.
+# db.create_all() only creates missing tables, it never changes a table that is already
+# there. Changes to existing databases are listed in MIGRATIONS instead, each with a version
+# number, and `flask db-migrate` applies the ones not yet recorded in schema_migrations, in
+# order, each in its own transaction. Migrations must also work on a database that
+# create_all() just made (use IF NOT EXISTS), since new models already carry the change.
+# Both `flask init-db` (initialize()) and `flask db-migrate` run upgrade(): create_all() for
+# the missing tables, then the pending migrations, and only then anything that queries
+# through the models (the search index), since the models may already have columns that a
+# migration has yet to add. A new and an upgraded database end up with the same schema.
+
+
+def _dedupe_scores(conn):
+    """Keeps the first attempt of each (user, quiz) so the unique index can be created."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS user_subject_scores ("
+        "user_id INTEGER NOT NULL REFERENCES users (id), subject_id INTEGER NOT NULL REFERENCES subjects (id), "
+        "total_score INTEGER NOT NULL, attempts INTEGER NOT NULL, PRIMARY KEY (user_id, subject_id))"
+    ))
+    deleted = conn.execute(text(
+        "DELETE FROM scores WHERE id NOT IN "
+        "(SELECT MIN(id) FROM scores GROUP BY user_id, quiz_id)"
+    )).rowcount
+    if deleted:
+        current_app.logger.warning("migration 1: removed %d duplicate score rows (later attempts of a quiz)", deleted)
+    # recompute the rollup: it still counts the removed attempts, or create_all() / the
+    # statement above just made it empty on a database that already has scores
+    conn.execute(text("DELETE FROM user_subject_scores"))
+    conn.execute(text(
+        "INSERT INTO user_subject_scores (user_id, subject_id, total_score, attempts) "
+        "SELECT s.user_id, c.subject_id, SUM(s.total_scored), COUNT(s.id) FROM scores s "
+        "JOIN quizzes q ON q.id = s.quiz_id JOIN chapters c ON c.id = q.chapter_id "
+        "GROUP BY s.user_id, c.subject_id"
+    ))
+
+
+def _hot_path_indexes(conn):
+    _dedupe_scores(conn)
+    for statement in (
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_scores_user_quiz ON scores (user_id, quiz_id)",
+        "CREATE INDEX IF NOT EXISTS ix_scores_user_id ON scores (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_scores_quiz_id ON scores (quiz_id, total_scored)",
+        "CREATE INDEX IF NOT EXISTS ix_quizzes_date_of_quiz ON quizzes (date_of_quiz, id)",
+        "CREATE INDEX IF NOT EXISTS ix_quizzes_chapter_id ON quizzes (chapter_id)",
+        "CREATE INDEX IF NOT EXISTS ix_chapters_subject_id ON chapters (subject_id)",
+        "CREATE INDEX IF NOT EXISTS ix_questions_quiz_id ON questions (quiz_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_user_subject_scores_subject_id ON user_subject_scores (subject_id)",
+    ):
+        conn.execute(text(statement))
+
+
+def _cache_generation_timestamps(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS cache_generations ("
+        "name VARCHAR(50) PRIMARY KEY, generation INTEGER NOT NULL, changed_at DATETIME)"
+    ))
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(cache_generations)"))}
+    if 'changed_at' not in columns:
+        conn.execute(text("ALTER TABLE cache_generations ADD COLUMN changed_at DATETIME"))
+
+
+def _score_answers(conn):
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(scores)"))}
+    if 'answers' not in columns:
+        conn.execute(text("ALTER TABLE scores ADD COLUMN answers BLOB"))
+    if 'question_set' not in columns:
+        conn.execute(text("ALTER TABLE scores ADD COLUMN question_set INTEGER"))
+
+
+def _quiz_score_counts(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS quiz_score_counts ("
+        "quiz_id INTEGER NOT NULL REFERENCES quizzes (id), total_scored INTEGER NOT NULL, "
+        "attempts INTEGER NOT NULL, PRIMARY KEY (quiz_id, total_scored))"
+    ))
+    # create_all() may have made it empty on a database that already has scores
+    conn.execute(text("DELETE FROM quiz_score_counts"))
+    conn.execute(text(
+        "INSERT INTO quiz_score_counts (quiz_id, total_scored, attempts) "
+        "SELECT quiz_id, total_scored, COUNT(id) FROM scores GROUP BY quiz_id, total_scored"
+    ))
+
+
+def _question_sampling(conn):
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(quizzes)"))}
+    if 'sample_size' not in columns:
+        conn.execute(text("ALTER TABLE quizzes ADD COLUMN sample_size INTEGER"))
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(scores)"))}
+    if 'question_ids' not in columns:
+        conn.execute(text("ALTER TABLE scores ADD COLUMN question_ids BLOB"))
+
+
+# (version, name, function(connection)), append only
+MIGRATIONS = [
+    (1, 'hot path indexes', _hot_path_indexes),
+    (2, 'cache generation timestamps', _cache_generation_timestamps),
+    (3, 'packed answers per attempt', _score_answers),
+    (4, 'quiz leaderboards', _quiz_score_counts),
+    (5, 'question sampling', _question_sampling),
+]
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+
+
+def applied_versions():
+    with db.engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending():
+    done = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate():
+    """Applies the pending migrations in order. Returns the list of (version, name) applied."""
+    applied = []
+    for version, name, apply in pending():
+        with db.engine.begin() as conn:
+            apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {'v': version, 'n': name, 't': datetime.utcnow()},
+            )
+        applied.append((version, name))
+    return applied
+
+
+def upgrade():
+    """Creates missing tables, applies the pending migrations, then the search index. Returns migrate()'s list."""
+    db.create_all()
+    applied = migrate()
+    search.ensure_index()
+    db.session.commit()
+    return applied
+
+
+def initialize(admin_password):
+    """
+    One-time setup of a database, run by `flask init-db` before the app serves requests (safe
+    to repeat). Creates the tables, applies the migrations, creates the search index and adds
+    the admin user if there is none. Returns True when the admin user was created.
+    """
+    upgrade()
+    # several deployments may run this at once: the unique username decides, not a SELECT first
+    stmt = insert(User).values(
+        username='admin',
+        password=generate_password_hash(admin_password, current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')),
+        full_name='Administrator',
+        is_admin=True,
+    ).on_conflict_do_nothing(index_elements=['username'])
+    created = db.session.execute(stmt).rowcount == 1
+    if created:
+        # the search index was built before the admin existed
+        search.index_object(User.query.filter_by(username='admin').one())
+    db.session.commit()
+    return created
+
+
+# ---- query plan check ----
+# The queries the busy pages run on every request. Each one must find its rows through an
+# index: a full table scan (or sorting the whole table) means an index went missing.
+HOT_QUERIES = {
+    'start_quiz existing attempt':
+        "SELECT id FROM scores WHERE user_id = :a AND quiz_id = :b LIMIT 1",
+    'user_scores page':
+        "SELECT * FROM scores WHERE user_id = :a AND id > :b ORDER BY id LIMIT 26",
+    'user_dashboard upcoming quizzes':
+        "SELECT * FROM quizzes WHERE date_of_quiz >= :a AND (date_of_quiz, id) > (:a, :b) "
+        "ORDER BY date_of_quiz, id LIMIT 26",
+    'quiz questions':
+        "SELECT * FROM questions WHERE quiz_id = :a ORDER BY id",
+    'question bank ids':
+        "SELECT id FROM questions WHERE quiz_id = :a ORDER BY id",
+    'drawn questions':
+        "SELECT * FROM questions WHERE id IN (:a, :b) AND quiz_id = :a",
+    'chapters of subjects':
+        "SELECT * FROM chapters WHERE subject_id IN (:a, :b)",
+    'quizzes of chapters':
+        "SELECT * FROM quizzes WHERE chapter_id IN (:a, :b)",
+    'scores of quiz':
+        "SELECT user_id, total_scored FROM scores WHERE quiz_id = :a",
+    'user summary rollup':
+        "SELECT * FROM user_subject_scores WHERE user_id = :a",
+    'quiz standing':
+        "SELECT total_scored, attempts FROM quiz_score_counts WHERE quiz_id = :a",
+    'quiz leaderboard top':
+        "SELECT id, user_id FROM scores WHERE quiz_id = :a ORDER BY total_scored DESC LIMIT 10",
+}
+
+_BAD_PLAN = re.compile(r'^SCAN (?!CONSTANT ROW)|USE TEMP B-TREE FOR ORDER BY')
+
+
+def check_query_plans():
+    """Returns {query name: [offending plan lines]} for hot queries that do not use an index."""
+    problems = {}
+    with db.engine.connect() as conn:
+        for name, sql in HOT_QUERIES.items():
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), {'a': 1, 'b': 2}).all()
+            bad = [row[-1] for row in plan if _BAD_PLAN.search(row[-1])]
+            if bad:
+                problems[name] = bad
+    return problems
@@ -1,6 +1,9 @@
 from controllers.database import db
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import deferred
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -31,6 +34,8 @@ class Subject(db.Model):
 
 class Chapter(db.Model):
     __tablename__ = 'chapters'
+    # indexes are also created on existing databases by migration 1 (controllers/migrations.py)
+    __table_args__ = (db.Index('ix_chapters_subject_id', 'subject_id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -43,11 +48,17 @@ class Chapter(db.Model):
 
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        db.Index('ix_quizzes_chapter_id', 'chapter_id'),
+        db.Index('ix_quizzes_date_of_quiz', 'date_of_quiz', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
     date_of_quiz = db.Column(db.DateTime, nullable=False)
     time_duration = db.Column(db.String(50), nullable=False)  # Format: "HH:MM"
     remarks = db.Column(db.Text)
+    # questions drawn for each attempt from the quiz's questions (None = all of them)
+    sample_size = db.Column(db.Integer)
     #one-many
     questions = db.relationship('Question', backref='quiz',lazy=True)
     #one to many
@@ -58,6 +69,7 @@ class Quiz(db.Model):
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (db.Index('ix_questions_quiz_id', 'quiz_id', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     question_statement = db.Column(db.Text, nullable=False)
@@ -72,11 +84,72 @@ class Question(db.Model):
 
 class Score(db.Model):
     __tablename__ = 'scores'
+    __table_args__ = (
+        # one attempt per user and quiz
+        db.Index('ix_scores_user_quiz', 'user_id', 'quiz_id', unique=True),
+        # a user's scores in id order, for the keyset-paginated scores page
+        db.Index('ix_scores_user_id', 'user_id', 'id'),
+        db.Index('ix_scores_quiz_id', 'quiz_id', 'total_scored'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     total_scored = db.Column(db.Integer, nullable=False)
+    # the submitted option (1-4, 0 = unanswered) per question, one byte each in question id
+    # order, and the answer_keys question_set it refers to; only loaded by the item analysis.
+    # For a sampled quiz question_ids holds the drawn question ids (answer_keys.pack_ids) and
+    # answers follows their order
+    answers = deferred(db.Column(db.LargeBinary))
+    question_set = deferred(db.Column(db.Integer))
+    question_ids = deferred(db.Column(db.LargeBinary))
 
     def __repr__(self):
-        return f"Score('User {self.user_id}', 'Quiz {self.quiz_id}', '{self.total_scored}')"
\ No newline at end of file
+        return f"Score('User {self.user_id}', 'Quiz {self.quiz_id}', '{self.total_scored}')"
+
+class UserSubjectScore(db.Model):
+    # denormalized rollup of scores per user per subject, kept in step with the scores table
+    # so the user summary page is a single lookup instead of walking every score
+    __tablename__ = 'user_subject_scores'
+    __table_args__ = (db.Index('ix_user_subject_scores_subject_id', 'subject_id'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), primary_key=True)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"UserSubjectScore('User {self.user_id}', 'Subject {self.subject_id}', '{self.total_score}')"
+
+class CacheGeneration(db.Model):
+    # counters bumped on every change to cached data (e.g. 'catalog'), so each worker
+    # process can tell with one primary-key lookup whether its in-memory copy is stale
+    __tablename__ = 'cache_generations'
+    name = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last-Modified of pages built from it
+
+    def __repr__(self):
+        return f"CacheGeneration('{self.name}', '{self.generation}')"
+
+def bump_generations(names):
+    """Adds 1 to each named counter (creating it at 1) and sets its changed_at. Caller commits."""
+    now = datetime.utcnow()
+    stmt = insert(CacheGeneration).values(
+        name=bindparam('b_name'), generation=1, changed_at=bindparam('b_now'),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'generation': CacheGeneration.generation + 1, 'changed_at': stmt.excluded.changed_at},
+    )
+    db.session.execute(stmt, [{'b_name': name, 'b_now': now} for name in names])
+
+class QuizScoreCount(db.Model):
+    # number of attempts of each quiz per total, kept in step with the scores table; a rank
+    # or percentile is a sum over the few rows of one quiz instead of sorting its scores
+    __tablename__ = 'quiz_score_counts'
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), primary_key=True)
+    total_scored = db.Column(db.Integer, primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"QuizScoreCount('Quiz {self.quiz_id}', '{self.total_scored}', '{self.attempts}')"
@@ -0,0 +1,155 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date
+from flask import current_app, request, abort
+from sqlalchemy import tuple_
+
+# Keyset ("seek") pagination for the list pages.
+# Instead of OFFSET, a page remembers the sort key of its last (or first) row and the next
+# query continues with WHERE (sort key) > (that key). The cost of a page is the same
+# whether it is the first one or the thousandth, and rows do not shift between pages when
+# new ones are added. The sort key must end with a unique column (normally the id).
+
+
+class Page:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_to_json(v) for v in values], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decodes a cursor from the query string, 400 if it was tampered with."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = [_from_json(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        abort(400)
+    if not isinstance(values, list) or len(values) != size:
+        abort(400)
+    return values
+
+
+def page_size(default=None):
+    """per_page from the query string, bounded by MAX_PER_PAGE."""
+    default = default or current_app.config.get('PER_PAGE', 25)
+    limit = current_app.config.get('MAX_PER_PAGE', 100)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, limit))
+
+
+def paginate(query, columns, per_page=None, descending=False, after=None, before=None):
+    """
+    Returns one Page of `query` ordered by `columns` (last one unique).
+    `after`/`before` are cursors from a previous Page; by default they are read from
+    the request's ?after= / ?before= arguments.
+    """
+    if after is None and before is None:
+        after = request.args.get('after')
+        before = request.args.get('before')
+    per_page = per_page or page_size()
+    key = tuple_(*columns)
+
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    # walking backwards means reading the opposite order and flipping the rows afterwards
+    reverse = descending != backwards
+    if cursor:
+        values = tuple_(*decode_cursor(cursor, len(columns)))
+        query = query.filter(key < values if reverse else key > values)
+    order = [c.desc() for c in columns] if reverse else [c.asc() for c in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_of(item):
+        return encode_cursor([getattr(item, c.key) for c in columns])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = cursor_of(rows[-1])
+        if (more and backwards) or (cursor and not backwards):
+            prev_cursor = cursor_of(rows[0])
+    return Page(rows, per_page, next_cursor, prev_cursor)
+
+
+def _seek(bisect, items, cursor, key, size):
+    """Position of a cursor in a sorted list, 400 if its values cannot be compared with the keys."""
+    try:
+        return bisect(items, tuple(decode_cursor(cursor, size)), key=key)
+    except TypeError:
+        abort(400)
+
+
+def paginate_items(items, names, per_page=None, after=None, before=None):
+    """
+    Same as paginate() for a list already sorted by the attributes `names` (last one
+    unique), e.g. a cached snapshot. Cursors are interchangeable with the database version.
+    """
+    if after is None and before is None:
+        after = request.args.get('after')
+        before = request.args.get('before')
+    per_page = per_page or page_size()
+
+    def key(item):
+        return tuple(getattr(item, name) for name in names)
+
+    if before is not None and after is None:
+        end = _seek(bisect_left, items, before, key, len(names)) if before else len(items)
+        start = max(0, end - per_page)
+        rows = items[start:end]
+        more_before, more_after = start > 0, end < len(items)
+    else:
+        start = _seek(bisect_right, items, after, key, len(names)) if after else 0
+        rows = items[start:start + per_page]
+        more_before, more_after = start > 0, start + per_page < len(items)
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more_after:
+            next_cursor = encode_cursor(key(rows[-1]))
+        if more_before:
+            prev_cursor = encode_cursor(key(rows[0]))
+    return Page(list(rows), per_page, next_cursor, prev_cursor)
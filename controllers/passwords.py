@@ -0,0 +1,77 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing off the request threads.
+# scrypt/pbkdf2 cost tens of milliseconds of CPU per call. The calls run in a small process
+# pool, and at most PASSWORD_HASH_QUEUE_LIMIT of them may be running or waiting at once:
+# beyond that HashingBusy is raised right away so the route can answer "try again" instead
+# of piling up requests while every other page starves. A call that does not finish within
+# PASSWORD_HASH_TIMEOUT seconds raises HashingBusy too.
+
+
+class HashingBusy(Exception):
+    """Too many password hashes already queued, or the pool did not answer in time."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_current_prefix = {}  # method -> parameter prefix of hashes made with it
+
+
+def _get_pool():
+    global _pool
+    workers = current_app.config.get('PASSWORD_HASH_WORKERS', 2)
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # not forked: this runs in a request thread while other threads may hold locks
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _get_slots():
+    global _slots
+    with _pool_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(current_app.config.get('PASSWORD_HASH_QUEUE_LIMIT', 32))
+        return _slots
+
+
+def _run(fn, *args):
+    slots = _get_slots()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        pool = _get_pool()
+        if pool is None:
+            return fn(*args)
+        timeout = current_app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        try:
+            return pool.submit(fn, *args).result(timeout=timeout)
+        except FutureTimeout:
+            raise HashingBusy() from None
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+
+
+def verify_password(stored_hash, password):
+    return _run(check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    """True when the stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    if method not in _current_prefix:
+        # werkzeug fills in default parameters ('scrypt' -> 'scrypt:32768:8:1'), so take the
+        # prefix from one real hash instead of parsing the setting (done once per method)
+        _current_prefix[method] = generate_password_hash('', method).split('$', 1)[0]
+    return stored_hash.split('$', 1)[0] != _current_prefix[method]
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+from sqlalchemy import insert
+from controllers.database import db
+from controllers.models import Question
+from controllers import search, answer_keys
+
+# Bulk import of questions into a quiz from CSV or JSONL.
+# The file is read one row at a time and valid rows are inserted in batches with a single
+# executemany INSERT per batch, so memory stays bounded by the batch size whatever the
+# file size. Both formats use the columns of the add-question form:
+#   question_statement, option1, option2, option3, option4, correct_option (1-4)
+
+FIELDS = ('question_statement', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []  # (line number, message), only the first MAX_REPORTED_ERRORS
+        self.rolled_back = False
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_rows(stream, fmt):
+    """Yields (line number, row) from a binary stream. row is a dict, or an error string."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"invalid JSON: {e}"
+                continue
+            yield line_no, row if isinstance(row, dict) else "expected a JSON object"
+    else:
+        reader = csv.DictReader(text)
+        missing = [f for f in FIELDS if f not in (reader.fieldnames or [])]
+        if missing:
+            yield 1, f"missing columns: {', '.join(missing)}"
+            return
+        for row in reader:
+            yield reader.line_num, row
+
+
+def validate(row):
+    """Returns (values, None) for a good row or (None, error message)."""
+    values = {}
+    for field in FIELDS[:5]:
+        value = row.get(field)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            return None, f"{field} is required"
+        if field != 'question_statement' and len(value) > 255:
+            return None, f"{field} is longer than 255 characters"
+        values[field] = value
+    try:
+        correct_option = int(str(row.get('correct_option', '')).strip())
+    except ValueError:
+        return None, "correct_option must be a number (1-4)"
+    if not 1 <= correct_option <= 4:
+        return None, "correct_option must be between 1 and 4"
+    values['correct_option'] = correct_option
+    return values, None
+
+
+def _flush(quiz_id, batch):
+    """Inserts one batch with executemany and adds the new questions to the search index."""
+    for values in batch:
+        values['quiz_id'] = quiz_id
+    ids = db.session.execute(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True), batch
+    ).scalars().all()
+    search.index_rows('question', ((i, v['question_statement'], '') for i, v in zip(ids, batch)))
+    answer_keys.invalidate(quiz_id)
+    return len(ids)
+
+
+def import_questions(quiz_id, stream, fmt='csv', all_or_nothing=False, batch_size=500):
+    """
+    Imports questions into quiz_id and returns an ImportReport.
+    Normally every batch is committed on its own and bad rows are skipped. With
+    all_or_nothing the whole file is one transaction that is rolled back on any error.
+    """
+    report = ImportReport()
+    batch = []
+    try:
+        for line_no, row in iter_rows(stream, fmt):
+            if isinstance(row, str):
+                report.add_error(line_no, row)
+                continue
+            values, error = validate(row)
+            if error:
+                report.add_error(line_no, error)
+                continue
+            if all_or_nothing and report.error_count:
+                continue  # keep validating for the report, nothing will be inserted
+            batch.append(values)
+            if len(batch) >= batch_size:
+                report.inserted += _flush(quiz_id, batch)
+                batch = []
+                if not all_or_nothing:
+                    db.session.commit()
+        if all_or_nothing and report.error_count:
+            db.session.rollback()
+            report.inserted = 0
+            report.rolled_back = True
+        else:
+            if batch:
+                report.inserted += _flush(quiz_id, batch)
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+from collections import namedtuple
+from flask import jsonify
+from controllers import answer_keys
+
+# JSON delivery of quizzes, for clients that show the questions and collect the answers
+# themselves and send them back in one request.
+# - GET /api/quiz/<id> returns the questions and options (never the correct ones) as one
+#   payload: {"id", "duration", "version", "questions": [{"id", "text", "options": [4 texts]}]}
+#   A whole quiz has the same payload for every student, so it is serialized once per
+#   answer_keys snapshot and sent with a content ETag: a client that has it gets a 304.
+#   A draw from a question bank is built per student (sample_size questions).
+# - POST /api/quiz/<id>/submit takes {"version": ..., "answers": [...]}, one option (1-4,
+#   0 or null = unanswered) per question in payload order, and returns the score, the
+#   correct options and the standing. The version is a checksum of the question ids in
+#   payload order; when the questions changed in between the submit is refused (409).
+
+Payload = namedtuple('Payload', 'body etag version')
+
+_payloads = {}  # quiz id -> (CompiledQuiz, duration, Payload), whole quizzes only
+_lock = threading.Lock()
+
+
+def version_of(quiz):
+    return answer_keys.question_set_of(q.id for q in quiz.questions)
+
+
+def _build(quiz, duration):
+    version = version_of(quiz)
+    body = json.dumps({
+        'id': quiz.id,
+        'duration': duration,
+        'version': version,
+        'questions': [
+            {'id': q.id, 'text': q.question_statement, 'options': [q.option1, q.option2, q.option3, q.option4]}
+            for q in quiz.questions
+        ],
+    }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return Payload(body, hashlib.sha256(body).hexdigest()[:32], version)
+
+
+def payload(quiz, duration):
+    """The Payload of a quiz as returned by answer_keys.for_attempt()."""
+    if quiz.bank is not None:
+        return _build(quiz, duration)
+    cached = _payloads.get(quiz.id)
+    # a new snapshot (questions changed, or the TTL ran out) is a new object
+    if cached is not None and cached[0] is quiz and cached[1] == duration:
+        return cached[2]
+    built = _build(quiz, duration)
+    with _lock:
+        _payloads[quiz.id] = (quiz, duration, built)
+    return built
+
+
+def answers_from_json(quiz, data):
+    """The submitted answers as bytes in question order; ValueError when malformed."""
+    answers = data.get('answers') if isinstance(data, dict) else None
+    if not isinstance(answers, list) or len(answers) != len(quiz.questions):
+        raise ValueError("'answers' must be a list with one entry per question.")
+    packed = bytearray(len(answers))
+    for i, answer in enumerate(answers):
+        if answer is None:
+            continue
+        if type(answer) is not int or not 0 <= answer <= 4:
+            raise ValueError("Every answer must be 1-4, or 0 / null when unanswered.")
+        packed[i] = answer
+    return bytes(packed)
+
+
+def result(quiz, score, standing):
+    return jsonify(score=score, total=len(quiz.questions), correct=list(quiz.correct),
+                   rank=standing.rank, attempts=standing.attempts, percentile=round(standing.percentile, 1))
+
+
+def error(status, message):
+    resp = jsonify(error=message)
+    resp.status_code = status
+    return resp
@@ -0,0 +1,167 @@
+from sqlalchemy import func, update, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from controllers.database import db
+from controllers.models import User, Subject, Chapter, Quiz, Score, UserSubjectScore
+
+# Reporting queries for the summary pages.
+# Everything here is done with GROUP BY in the database so the number of queries
+# (and the number of rows coming back) does not grow with the number of scores.
+
+
+def subject_attempt_counts():
+    """
+    Returns (subject_name, distinct_users) tuples, one per subject.
+    Subjects nobody attempted yet are still listed with 0.
+    """
+    rows = (
+        db.session.query(
+            Subject.name.label('subject_name'),
+            func.count(func.distinct(Score.user_id)).label('distinct_users'),
+        )
+        .outerjoin(Chapter, Chapter.subject_id == Subject.id)
+        .outerjoin(Quiz, Quiz.chapter_id == Chapter.id)
+        .outerjoin(Score, Score.quiz_id == Quiz.id)
+        .group_by(Subject.id, Subject.name)
+        .order_by(Subject.id)
+        .all()
+    )
+    return [tuple(r) for r in rows]
+
+
+def user_score_summaries():
+    """
+    Returns (username, full_name, total_quizzes, total_score) rows for every non-admin user.
+    Rows are named tuples so templates can use summary.username etc.
+    """
+    return (
+        db.session.query(
+            User.username.label('username'),
+            User.full_name.label('full_name'),
+            func.count(func.distinct(Score.quiz_id)).label('total_quizzes'),
+            func.coalesce(func.sum(Score.total_scored), 0).label('total_score'),
+        )
+        .outerjoin(Score, Score.user_id == User.id)
+        .filter(User.is_admin == False)  # noqa: E712
+        .group_by(User.id, User.username, User.full_name)
+        .order_by(User.id)
+        .all()
+    )
+
+
+# ---- per user / per subject rollup (user_subject_scores) ----
+# These helpers only add statements to the current session, the caller commits them
+# together with the score insert/delete so the rollup never drifts from the scores table.
+
+def add_scores_to_rollup(rows):
+    """
+    Adds attempts to the users' rows for their subjects (upsert, one executemany).
+    rows are dicts with user_id, subject_id and total_scored.
+    """
+    stmt = insert(UserSubjectScore).values(
+        user_id=bindparam('user_id'), subject_id=bindparam('subject_id'),
+        total_score=bindparam('total_scored'), attempts=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'subject_id'],
+        set_={
+            'total_score': UserSubjectScore.total_score + stmt.excluded.total_score,
+            'attempts': UserSubjectScore.attempts + 1,
+        },
+    )
+    db.session.execute(stmt, [
+        {'user_id': r['user_id'], 'subject_id': r['subject_id'], 'total_scored': r['total_scored']}
+        for r in rows
+    ])
+
+
+def remove_quizzes_from_rollup(quiz_ids):
+    """
+    Takes the scores of the given quizzes back out of the rollup.
+    quiz_ids is a list of ids or a SELECT of ids. Must be called before those scores are deleted.
+    """
+    if isinstance(quiz_ids, (list, tuple)) and not quiz_ids:
+        return
+    rows = (
+        db.session.query(
+            Score.user_id,
+            Chapter.subject_id,
+            func.sum(Score.total_scored),
+            func.count(Score.id),
+        )
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .filter(Score.quiz_id.in_(quiz_ids))
+        .group_by(Score.user_id, Chapter.subject_id)
+        .all()
+    )
+    if rows:
+        rollup = UserSubjectScore.__table__
+        db.session.execute(
+            update(rollup)
+            .where(rollup.c.user_id == bindparam('b_user'), rollup.c.subject_id == bindparam('b_subject'))
+            .values(total_score=rollup.c.total_score - bindparam('b_total'),
+                    attempts=rollup.c.attempts - bindparam('b_count')),
+            [{'b_user': u, 'b_subject': s, 'b_total': t, 'b_count': c} for u, s, t, c in rows],
+        )
+    UserSubjectScore.query.filter(UserSubjectScore.attempts <= 0).delete(synchronize_session=False)
+
+
+def remove_subject_from_rollup(subject_id):
+    UserSubjectScore.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+
+
+def rebuild_rollup():
+    """Recomputes user_subject_scores from the scores table. Returns number of rows written."""
+    UserSubjectScore.query.delete(synchronize_session=False)
+    select_rows = (
+        db.session.query(
+            Score.user_id,
+            Chapter.subject_id,
+            func.sum(Score.total_scored),
+            func.count(Score.id),
+        )
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .group_by(Score.user_id, Chapter.subject_id)
+    )
+    result = db.session.execute(
+        insert(UserSubjectScore).from_select(
+            ['user_id', 'subject_id', 'total_score', 'attempts'], select_rows
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def user_subject_totals(user_id):
+    """Returns (subject_name, total_score) for every subject, 0 where the user has no attempts."""
+    rows = (
+        db.session.query(
+            Subject.name,
+            func.coalesce(UserSubjectScore.total_score, 0),
+        )
+        .outerjoin(
+            UserSubjectScore,
+            (UserSubjectScore.subject_id == Subject.id) & (UserSubjectScore.user_id == user_id),
+        )
+        .order_by(Subject.id)
+        .all()
+    )
+    return [tuple(r) for r in rows]
+
+
+def latest_score():
+    """(id, timestamp) of the newest score of all, (None, None) without scores."""
+    row = db.session.query(Score.id, Score.timestamp).order_by(Score.id.desc()).first()
+    return tuple(row) if row else (None, None)
+
+
+def user_scores_version(user_id):
+    """(number of scores, latest score id, its timestamp) for a user; changes with every new attempt."""
+    count, last_id = (
+        db.session.query(func.count(Score.id), func.max(Score.id))
+        .filter(Score.user_id == user_id)
+        .one()
+    )
+    last_at = db.session.query(Score.timestamp).filter(Score.id == last_id).scalar() if last_id else None
+    return count, last_id, last_at
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+from datetime import datetime, date, timedelta
+from flask import abort
+from sqlalchemy import select
+from controllers.database import db
+from controllers.models import User, Subject, Chapter, Quiz, Score
+
+# Export of every score with its user, quiz, chapter and subject.
+# Rows are read with yield_per, so the cursor is walked in batches of BATCH_SIZE rows and
+# each batch is turned into CSV or NDJSON text and handed on (to the HTTP response or a
+# file) before the next one is fetched. Memory use is the same for a thousand rows as for
+# ten million. In the default (non-WAL) database mode a long export keeps a read lock and
+# delays writers until it finishes; production mode or the CLI are better for big exports.
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+BATCH_SIZE = 1000
+
+COLUMNS = [
+    ('score_id', Score.id),
+    ('user_id', User.id),
+    ('username', User.username),
+    ('full_name', User.full_name),
+    ('subject_id', Subject.id),
+    ('subject', Subject.name),
+    ('chapter_id', Chapter.id),
+    ('chapter', Chapter.name),
+    ('quiz_id', Quiz.id),
+    ('quiz_date', Quiz.date_of_quiz),
+    ('total_scored', Score.total_scored),
+    ('attempted_at', Score.timestamp),
+]
+HEADER = [name for name, _ in COLUMNS]
+
+
+def export_query(date_from=None, date_to=None, subject_id=None, quiz_id=None):
+    """
+    SELECT of the export rows in score id order. date_from/date_to (dates, both inclusive)
+    filter on the attempt time.
+    """
+    stmt = (
+        select(*[column.label(name) for name, column in COLUMNS])
+        .join(User, User.id == Score.user_id)
+        .join(Quiz, Quiz.id == Score.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .order_by(Score.id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(Score.timestamp >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        stmt = stmt.where(Score.timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if subject_id is not None:
+        stmt = stmt.where(Chapter.subject_id == subject_id)
+    if quiz_id is not None:
+        stmt = stmt.where(Score.quiz_id == quiz_id)
+    return stmt
+
+
+def iter_batches(stmt, batch_size=BATCH_SIZE):
+    """Lists of result rows, batch_size at a time, from one streaming cursor."""
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def iter_csv(stmt, batch_size=BATCH_SIZE):
+    """The export as CSV text, one chunk per batch (the header is the first chunk)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    yield buffer.getvalue()
+    for rows in iter_batches(stmt, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_text(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+
+
+def iter_ndjson(stmt, batch_size=BATCH_SIZE):
+    """The export as newline-delimited JSON objects, one chunk per batch."""
+    for rows in iter_batches(stmt, batch_size):
+        yield ''.join(
+            json.dumps(dict(zip(HEADER, row)), default=_text, separators=(',', ':')) + '\n'
+            for row in rows
+        )
+
+
+def iter_export(fmt, stmt, batch_size=BATCH_SIZE):
+    return iter_csv(stmt, batch_size) if fmt == 'csv' else iter_ndjson(stmt, batch_size)
+
+
+def filters_from_args(args):
+    """export_query() keyword arguments from a query string, 400 on malformed values."""
+    filters = {}
+    try:
+        for name in ('date_from', 'date_to'):
+            if args.get(name):
+                filters[name] = date.fromisoformat(args[name])
+        for name in ('subject_id', 'quiz_id'):
+            if args.get(name):
+                filters[name] = int(args[name])
+    except ValueError:
+        abort(400)
+    return filters
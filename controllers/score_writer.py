@@ -0,0 +1,234 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from controllers.database import db
+from controllers.models import Score
+from controllers import reports, leaderboard, metrics
+
+# Saving graded attempts.
+# By default every submission inserts its Score and commits on its own. With
+# SCORE_WRITE_BEHIND on, submissions are put on an in-process queue instead and a background
+# thread writes them in batches (every SCORE_FLUSH_INTERVAL_MS or SCORE_FLUSH_BATCH rows),
+# so a burst of submissions shares one transaction and one fsync. The submitting request
+# still waits until its batch is committed before showing the result, so an acknowledged
+# score is always on disk.
+
+SAVED = 'saved'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+
+def write_scores(rows):
+    """
+    Inserts score rows (dicts from score_row()) with their rollup and leaderboard updates. Returns one status per row; rows whose (user, quiz) already
+    has a score, in the table or earlier in `rows`, are DUPLICATE. Caller commits.
+    """
+    keys = [(r['user_id'], r['quiz_id']) for r in rows]
+    taken = set(db.session.execute(
+        select(Score.user_id, Score.quiz_id).where(tuple_(Score.user_id, Score.quiz_id).in_(keys))
+    ).tuples())
+    statuses, new_rows = [], []
+    for key, row in zip(keys, rows):
+        if key in taken:
+            statuses.append(DUPLICATE)
+        else:
+            taken.add(key)
+            statuses.append(SAVED)
+            new_rows.append(row)
+    if new_rows:
+        db.session.execute(insert(Score), [
+            {'user_id': r['user_id'], 'quiz_id': r['quiz_id'], 'total_scored': r['total_scored'],
+             'timestamp': r['timestamp'], 'answers': r['answers'], 'question_set': r['question_set'],
+             'question_ids': r['question_ids']}
+            for r in new_rows
+        ])
+        reports.add_scores_to_rollup(new_rows)
+        leaderboard.add_scores(new_rows)
+    return statuses
+
+
+def score_row(user_id, quiz_id, subject_id, total_scored, answers=None, question_set=None, question_ids=None):
+    return {'user_id': user_id, 'quiz_id': quiz_id, 'subject_id': subject_id,
+            'total_scored': total_scored, 'timestamp': datetime.utcnow(),
+            'answers': answers, 'question_set': question_set, 'question_ids': question_ids}
+
+
+class _Pending:
+    __slots__ = ('row', 'done', 'status')
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.status = None
+
+
+class ScoreWriter:
+    """Background writer with group commit, one per process."""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config.get('SCORE_FLUSH_INTERVAL_MS', 50) / 1000
+        self.batch_size = app.config.get('SCORE_FLUSH_BATCH', 200)
+        self.queue = queue.Queue()
+        self.in_flight = {}  # (user_id, quiz_id) -> _Pending, queued or being written
+        self.lock = threading.Lock()
+        self.stats = {'flushes': 0, 'rows': 0, 'duplicates': 0, 'failures': 0,
+                      'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
+        self._stopping = False
+        self.thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        metrics.add_source(app, self.prometheus)
+
+    def submit(self, row):
+        """
+        Queues a row and returns its _Pending. When the same attempt is already queued, that
+        one's _Pending is returned (its row is not `row`); None once the writer is stopping.
+        """
+        key = (row['user_id'], row['quiz_id'])
+        with self.lock:
+            if self._stopping:
+                return None
+            pending = self.in_flight.get(key)
+            if pending is not None:
+                return pending
+            pending = self.in_flight[key] = _Pending(row)
+        self.queue.put(pending)
+        return pending
+
+    def _collect(self):
+        try:
+            first = self.queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [p for p in batch if p is not None]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stopping and self.queue.empty():
+                return
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        statuses = None
+        with self.app.app_context():
+            for attempt in range(3):
+                try:
+                    written = write_scores([p.row for p in batch])
+                    db.session.commit()
+                    # only a committed batch has statuses, anything else is FAILED
+                    statuses = written
+                    break
+                except IntegrityError:
+                    # another process saved one of these attempts meanwhile; the next
+                    # round's lookup marks it as duplicate
+                    db.session.rollback()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("score writer: batch of %d failed", len(batch))
+                    time.sleep(0.05 * (attempt + 1))
+            db.session.remove()
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            for pending in batch:
+                self.in_flight.pop((pending.row['user_id'], pending.row['quiz_id']), None)
+            self.stats['flushes'] += 1
+            self.stats['last_flush_ms'] = elapsed
+            self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed)
+            self.stats['total_flush_ms'] += elapsed
+            if statuses is None:
+                self.stats['failures'] += len(batch)
+            else:
+                self.stats['rows'] += statuses.count(SAVED)
+                self.stats['duplicates'] += statuses.count(DUPLICATE)
+        for i, pending in enumerate(batch):
+            pending.status = FAILED if statuses is None else statuses[i]
+            pending.done.set()
+
+    def stop(self):
+        """Writes whatever is still queued, then ends the thread (also run at exit)."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self.queue.put(None)  # wakes the thread up
+        self.thread.join(timeout=30)
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def prometheus(self):
+        stats = self.metrics()
+        return [
+            ('quiz_score_writer_queue_depth', 'gauge', "Scores waiting to be written.", [([], stats['queue_depth'])]),
+            ('quiz_score_writer_flushes_total', 'counter', "Group commits.", [([], stats['flushes'])]),
+            ('quiz_score_writer_rows_total', 'counter', "Scores written, by result.", [
+                ([('result', SAVED)], stats['rows']),
+                ([('result', DUPLICATE)], stats['duplicates']),
+                ([('result', FAILED)], stats['failures']),
+            ]),
+            ('quiz_score_writer_flush_seconds_sum', 'counter', "Time spent in group commits.",
+             [([], stats['total_flush_ms'] / 1000)]),
+            ('quiz_score_writer_flush_seconds_max', 'gauge', "Slowest group commit.",
+             [([], stats['max_flush_ms'] / 1000)]),
+        ]
+
+
+_writers_lock = threading.Lock()
+
+
+def get_writer(app):
+    with _writers_lock:
+        writer = app.extensions.get('score_writer')
+        if writer is None:
+            writer = app.extensions['score_writer'] = ScoreWriter(app)
+        return writer
+
+
+def record_score(user_id, quiz_id, subject_id, total_scored, answers=None, question_set=None, question_ids=None):
+    """Saves a graded attempt and returns SAVED, DUPLICATE or FAILED once it is durable."""
+    row = score_row(user_id, quiz_id, subject_id, total_scored, answers, question_set, question_ids)
+    app = current_app._get_current_object()
+    if not app.config.get('SCORE_WRITE_BEHIND'):
+        try:
+            status = write_scores([row])[0]
+            db.session.commit()
+        except IntegrityError:
+            # a second submit of the same attempt lost the race on ix_scores_user_quiz
+            db.session.rollback()
+            status = DUPLICATE
+        return status
+
+    pending = get_writer(app).submit(row)
+    if pending is None:
+        return FAILED
+    # hand the request's connection back to the pool while waiting, otherwise a burst of
+    # waiting submitters can take every connection and leave none for the writer
+    db.session.close()
+    if not pending.done.wait(app.config.get('SCORE_ACK_TIMEOUT', 10)):
+        return FAILED
+    if pending.row is not row and pending.status == SAVED:
+        # a second submit of an attempt that was still being written: it exists now
+        return DUPLICATE
+    return pending.status
@@ -0,0 +1,130 @@
+import re
+from flask import current_app
+from sqlalchemy import text, delete, table, column
+from controllers.database import db
+from controllers.models import User, Subject, Quiz, Question
+from controllers.pagination import Page, encode_cursor, decode_cursor
+from controllers import loaders
+
+# Full text search over users, subjects, quizzes and questions using a SQLite FTS5 table.
+# Every searchable row gets one entry (kind, ref_id, title, body) in search_index.
+# The admin routes update the entries in the same transaction as the change itself,
+# and `flask rebuild-search-index` fills the table from scratch.
+
+# kind -> (model, function giving the (title, body) text that is indexed)
+SOURCES = {
+    'user': (User, lambda u: (u.username, u.full_name or '')),
+    'subject': (Subject, lambda s: (s.name, s.description or '')),
+    'quiz': (Quiz, lambda q: (q.remarks or '', '')),
+    'question': (Question, lambda q: (q.question_statement, '')),
+}
+KIND_OF_MODEL = {model: kind for kind, (model, _) in SOURCES.items()}
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_entries = table('search_index', column('kind'), column('ref_id'))
+
+
+def ensure_index():
+    """Creates the FTS5 table if it is missing, and fills it when it was just created."""
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_index'"
+    )).first()
+    if exists:
+        return
+    db.session.execute(text(
+        "CREATE VIRTUAL TABLE search_index USING fts5("
+        "kind UNINDEXED, ref_id UNINDEXED, title, body, "
+        "tokenize='unicode61', prefix='2 3')"
+    ))
+    rebuild_index()
+
+
+def _insert(kind, ref_id, title, body):
+    db.session.execute(
+        text("INSERT INTO search_index (kind, ref_id, title, body) VALUES (:kind, :ref_id, :title, :body)"),
+        {'kind': kind, 'ref_id': ref_id, 'title': title, 'body': body},
+    )
+
+
+def index_object(obj):
+    """Adds or refreshes the entry of a User/Subject/Quiz/Question. Caller commits."""
+    kind = KIND_OF_MODEL[type(obj)]
+    if obj.id is None:
+        db.session.flush()
+    remove_entries(kind, [obj.id])
+    title, body = SOURCES[kind][1](obj)
+    _insert(kind, obj.id, title, body)
+
+
+def index_rows(kind, rows):
+    """Adds entries for new rows given as (id, title, body), one executemany. Caller commits."""
+    params = [{'kind': kind, 'ref_id': ref_id, 'title': title, 'body': body} for ref_id, title, body in rows]
+    if params:
+        db.session.execute(
+            text("INSERT INTO search_index (kind, ref_id, title, body) VALUES (:kind, :ref_id, :title, :body)"),
+            params,
+        )
+
+
+def remove_entries(kind, ids):
+    """Drops the entries of the given kind. ids is a list or a SELECT of ids. Caller commits."""
+    if isinstance(ids, (list, tuple)) and not ids:
+        return
+    db.session.execute(delete(_entries).where(_entries.c.kind == kind, _entries.c.ref_id.in_(ids)))
+
+
+def rebuild_index():
+    """Recomputes search_index from the tables. Returns the number of entries written."""
+    db.session.execute(text("DELETE FROM search_index"))
+    count = 0
+    for kind, (model, extract) in SOURCES.items():
+        for obj in model.query.yield_per(500):
+            title, body = extract(obj)
+            _insert(kind, obj.id, title, body)
+            count += 1
+    db.session.commit()
+    return count
+
+
+def match_expression(query):
+    """
+    Turns user input into an FTS5 MATCH expression: every word has to match, the last
+    word may be a prefix (search as you type). Returns None if there is nothing to search.
+    """
+    words = _TOKEN.findall(query.lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]]
+    terms.append(f'"{words[-1]}"*')
+    return ' AND '.join(terms)
+
+
+def search(query, kinds, limit=None, after=None):
+    """
+    Returns {kind: Page} for the given kinds, best match (bm25) first, at most `limit`
+    results per kind (SEARCH_RESULT_LIMIT by default). `after` is the next_cursor of a
+    previous page and continues from there (keyset on rank, rowid).
+    """
+    limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 20)
+    expression = match_expression(query)
+    results = {}
+    for kind in kinds:
+        if expression is None:
+            results[kind] = Page([], limit)
+            continue
+        sql = "SELECT ref_id, rank, rowid FROM search_index WHERE search_index MATCH :q AND kind = :kind"
+        params = {'q': expression, 'kind': kind, 'limit': limit + 1}
+        if after:
+            params['rank'], params['rowid'] = decode_cursor(after, 2)
+            sql += " AND (rank, rowid) > (:rank, :rowid)"
+        rows = db.session.execute(text(sql + " ORDER BY rank, rowid LIMIT :limit"), params).all()
+        next_cursor = encode_cursor(rows[limit - 1][1:]) if len(rows) > limit else None
+        ids = [row[0] for row in rows[:limit]]
+        model = SOURCES[kind][0]
+        found = model.query.filter(model.id.in_(ids))
+        if kind == 'quiz':
+            # the result lists show the chapter and subject of each quiz
+            found = found.options(loaders.quiz_chapter_subject())
+        by_id = {obj.id: obj for obj in found} if ids else {}
+        results[kind] = Page([by_id[i] for i in ids if i in by_id], limit, next_cursor)
+    return results
@@ -0,0 +1,112 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+from operator import eq
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from controllers.database import db
+from controllers.models import User, Subject, Chapter, Quiz, Question, Score
+from controllers import reports, search, catalog, answer_keys, leaderboard
+
+# Synthetic data for load testing (`flask seed-data`, bench.py).
+# Rows are written with executemany INSERTs in batches, and the derived data (score
+# rollup, leaderboards, search index, catalog cache) is rebuilt at the end. Every run gets its own tag
+# in the usernames and subject names so it can be repeated on the same database.
+
+SEED_PASSWORD = 'Seed1234'
+BATCH = 2000
+
+
+def _insert_many(model, rows):
+    """Inserts dict rows in batches and returns their new ids in order."""
+    ids = []
+    for start in range(0, len(rows), BATCH):
+        chunk = rows[start:start + BATCH]
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids.extend(db.session.execute(stmt, chunk).scalars().all())
+    return ids
+
+
+def seed(users=200, subjects=10, chapters_per_subject=5, quizzes_per_chapter=4,
+         questions_per_quiz=10, attempts_per_user=20, random_seed=None):
+    """Generates the given volumes and returns a dict of row counts and the run tag."""
+    rng = random.Random(random_seed)
+    tag = uuid.uuid4().hex[:6]
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    # one real hash shared by all seeded users: logins cost the same as for real accounts
+    password = generate_password_hash(SEED_PASSWORD)
+
+    user_ids = _insert_many(User, [
+        {'username': f'seed_{tag}_{i}', 'password': password,
+         'full_name': f'Seed Student {i}', 'qualification': 'synthetic', 'is_admin': False}
+        for i in range(users)
+    ])
+    subject_ids = _insert_many(Subject, [
+        {'name': f'Subject {tag} {i}', 'description': f'Synthetic subject {i}'}
+        for i in range(subjects)
+    ])
+    chapter_ids = _insert_many(Chapter, [
+        {'name': f'Chapter {j}', 'description': 'Synthetic chapter', 'subject_id': sid}
+        for sid in subject_ids for j in range(chapters_per_subject)
+    ])
+    quiz_ids = _insert_many(Quiz, [
+        {'chapter_id': cid, 'date_of_quiz': today + timedelta(days=rng.randint(-180, 60)),
+         'time_duration': '00:30', 'remarks': f'synthetic quiz {k}'}
+        for cid in chapter_ids for k in range(quizzes_per_chapter)
+    ])
+    keys = {}  # quiz id -> (question ids, correct options), for the seeded answers
+
+    def insert_questions(rows):
+        for row, question_id in zip(rows, _insert_many(Question, rows)):
+            ids, correct = keys.setdefault(row['quiz_id'], ([], bytearray()))
+            ids.append(question_id)
+            correct.append(row['correct_option'])
+
+    question_rows = []
+    for qid in quiz_ids:
+        for n in range(questions_per_quiz):
+            question_rows.append({
+                'quiz_id': qid, 'question_statement': f'Synthetic question {n} of quiz {qid}?',
+                'option1': 'alpha', 'option2': 'beta', 'option3': 'gamma', 'option4': 'delta',
+                'correct_option': rng.randint(1, 4),
+            })
+            if len(question_rows) >= BATCH:
+                insert_questions(question_rows)
+                question_rows = []
+    insert_questions(question_rows)
+    question_sets = {qid: answer_keys.question_set_of(ids) for qid, (ids, _) in keys.items()}
+
+    score_count = 0
+    score_rows = []
+    attempts = min(attempts_per_user, len(quiz_ids))
+    for uid in user_ids:
+        # stronger students pick the correct option more often, so item statistics look real
+        ability = rng.random()
+        for qid in rng.sample(quiz_ids, attempts):
+            correct = keys.get(qid, ((), b''))[1]
+            answers = bytes(c if rng.random() < ability else rng.randint(0, 4) for c in correct)
+            score_rows.append({
+                'quiz_id': qid, 'user_id': uid, 'timestamp': today - timedelta(minutes=rng.randint(0, 260000)),
+                'total_scored': sum(map(eq, answers, correct)),
+                'answers': answers, 'question_set': question_sets.get(qid),
+            })
+        if len(score_rows) >= BATCH:
+            score_count += len(_insert_many(Score, score_rows))
+            score_rows = []
+    score_count += len(_insert_many(Score, score_rows))
+    db.session.commit()
+
+    reports.rebuild_rollup()
+    leaderboard.rebuild()
+    search.rebuild_index()
+    catalog.invalidate()
+    db.session.commit()
+    return {
+        'tag': tag,
+        'users': len(user_ids),
+        'subjects': len(subject_ids),
+        'chapters': len(chapter_ids),
+        'quizzes': len(quiz_ids),
+        'questions': len(quiz_ids) * questions_per_quiz,
+        'scores': score_count,
+    }
@@ -1,24 +1,49 @@
-import matplotlib
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-import io, base64
 from flask import render_template, session, redirect, url_for, flash, request
-from controllers.database import db
-from controllers.models import Quiz,Score,Subject,Chapter,User
+from controllers.database import read_only
+from controllers.models import Score
+from controllers import reports, charts, search, loaders, answer_keys, score_writer, catalog, http_cache, leaderboard, quiz_api
+from controllers.pagination import paginate, paginate_items
 from datetime import datetime
 
 def User_routes(app):
+    def dashboard_validators():
+        # the list of upcoming quizzes also changes at midnight
+        generation, changed_at = catalog.version()
+        return (generation, datetime.now().date()), changed_at
+
+    def scores_validators():
+        count, last_id, _ = reports.user_scores_version(session.get('user_id'))
+        # the ranks shown next to the scores move with every attempt of anyone
+        latest_id, latest_at = reports.latest_score()
+        generation, changed_at = catalog.version()
+        return (count, last_id, latest_id, generation), max(filter(None, (latest_at, changed_at)), default=None)
+
+    def scores_chart_spec(rows):
+        return charts.bar_chart_spec(
+            [name for name, _ in rows],
+            [points for _, points in rows],
+            color='purple',
+            xlabel="Subjects",
+            ylabel="Total Score",
+            title="Scores per Subject",
+        )
+
     @app.route('/user/dashboard')
+    @read_only
+    @http_cache.conditional(dashboard_validators)
     def user_dashboard():
         if 'user_id' not in session:
             flash("Please log in first.", "warning")
             return redirect(url_for('login'))
         
         today = datetime.now().date()
-        available_quiz = Quiz.query.filter(Quiz.date_of_quiz >= today).all()
+        # upcoming quizzes come from the in-memory catalog snapshot, see controllers/catalog.py
+        available_quiz = paginate_items(catalog.upcoming_quizzes(today), ['date_of_quiz', 'id'])
         return render_template('user_dashboard.html', quizzes=available_quiz)
 
     @app.route('/user/quiz/view/<int:quiz_id>')
+    @read_only
+    @http_cache.conditional(catalog.page_validators)
     def view_quiz_details(quiz_id):
         if 'user_id' not in session:
             flash("Please log in first!!", "warning")
@@ -26,10 +51,11 @@ def User_routes(app):
         if session.get('role') == 'Admin':
             flash("this is user dashboard!!!!!!", "danger")
             return redirect(url_for('admin_dashboard'))
-        quiz = Quiz.query.get_or_404(quiz_id)
+        quiz = catalog.quiz_or_404(quiz_id)
         return render_template('view_quiz.html', quiz=quiz)
     
     @app.route('/user/search') 
+    @read_only
     def user_search():
         if 'user_id' not in session:
             flash("Please log in!!!!!!", "warning")
@@ -39,13 +65,14 @@ def User_routes(app):
             return redirect(url_for('admin_dashboard'))
         
         query = request.args.get('q', '').strip()
-        results = {}
+        results = None
         if query:
-            from controllers.models import Subject, Quiz
-            results['subjects'] = Subject.query.filter(Subject.name.ilike(f'%{query}%')).all()
-            results['quizzes'] = Quiz.query.filter(Quiz.remarks.ilike(f'%{query}%')).all()
-        else:
-            results = None
+            kind = request.args.get('kind')
+            if kind in ('subject', 'quiz'):
+                found = search.search(query, [kind], after=request.args.get('after'))
+            else:
+                found = search.search(query, ['subject', 'quiz'])
+            results = {'subjects': found.get('subject'), 'quizzes': found.get('quiz')}
         return render_template('user_search.html', query=query, results=results)
 
 
@@ -55,57 +82,108 @@ def User_routes(app):
             flash("log in first.", "warning")
             return redirect(url_for('login'))
         user_id = session.get('user_id')
-        quiz = Quiz.query.get_or_404(quiz_id)
+        # compiled snapshot of the questions and answer key, shared by all attempts
+        quiz = answer_keys.get_or_404(quiz_id)
         existing_score = Score.query.filter_by(user_id=user_id, quiz_id=quiz.id).first()
         if existing_score:
             flash("You have already attempted this quiz.", "warning")
             return redirect(url_for('user_dashboard'))
+        # this user's questions when the quiz draws from a question bank
+        quiz = answer_keys.for_attempt(quiz, user_id)
         if request.method == 'POST':
-            score = 0
+            answers = answer_keys.parse_answers(quiz, request.form)
+            score = answer_keys.grade(quiz, answers)
             total = len(quiz.questions)
-            feedback = {}
-            for question in quiz.questions:
-                user_answer = request.form.get(f'question_{question.id}')
-                try:
-                    user_answer_int = int(user_answer) if user_answer else None
-                except ValueError:
-                    user_answer_int = None
-                correct = (user_answer_int is not None and user_answer_int == question.correct_option)
-                if correct:
-                    score += 1
-                feedback[question.id] = {
-                    "question_statement": question.question_statement,
-                    "user_answer": user_answer_int, 
-                    "correct_option": question.correct_option,
-                    "option_texts": {
-                        1: question.option1,
-                        2: question.option2,
-                        3: question.option3,
-                        4: question.option4,
-                    },
-                    "is_correct": correct
-                }
-            # Save the score in the database
-            user_id = session.get('user_id')
-            new_score = Score(quiz_id=quiz.id, user_id=user_id, total_scored=score)
-            db.session.add(new_score)
-            db.session.commit()
+            # Save the score (and its rollup) in the database, directly or through the
+            # write-behind queue; either way it is committed when this returns SAVED
+            status = score_writer.record_score(user_id, quiz.id, quiz.subject_id, score,
+                                               answers=answers, question_set=quiz.question_set,
+                                               question_ids=quiz.question_ids)
+            if status == score_writer.DUPLICATE:
+                flash("You have already attempted this quiz.", "warning")
+                return redirect(url_for('user_dashboard'))
+            if status == score_writer.FAILED:
+                flash("Your answers could not be saved yet, please check your scores before submitting again.", "danger")
+                return redirect(url_for('user_scores'))
             flash(f"You scored {score} out of {total}", "success")
-            # Passing the score and feedback to the results temp
-            return render_template('quiz_result.html', quiz=quiz, score=score, total=total, feedback=feedback)
+            # Passing the score, the submitted answers and the rank among all attempts to the results temp
+            return render_template('quiz_result.html', quiz=quiz, score=score, total=total, answers=answers,
+                                   standing=leaderboard.standing(quiz.id, score))
         return render_template('take_quiz.html', quiz=quiz)
 
+    @app.route('/api/quiz/<int:quiz_id>')
+    @read_only
+    def api_quiz(quiz_id):
+        """The quiz's questions as one JSON payload for clients that answer on their own."""
+        if 'user_id' not in session:
+            return quiz_api.error(401, "Log in first.")
+        user_id = session['user_id']
+        quiz = answer_keys.get(quiz_id)
+        catalog_quiz = catalog.get().quizzes.get(quiz_id)
+        if quiz is None or catalog_quiz is None:
+            return quiz_api.error(404, "No such quiz.")
+        if Score.query.filter_by(user_id=user_id, quiz_id=quiz_id).first():
+            return quiz_api.error(409, "You have already attempted this quiz.")
+        payload = quiz_api.payload(answer_keys.for_attempt(quiz, user_id), catalog_quiz.time_duration)
+        if http_cache.not_modified(payload.etag):
+            resp = app.response_class(status=304)
+        else:
+            resp = app.response_class(payload.body, mimetype='application/json')
+        resp.set_etag(payload.etag)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
+
+    @app.route('/api/quiz/<int:quiz_id>/submit', methods=['POST'])
+    def api_submit_quiz(quiz_id):
+        """Grades a JSON answer array (see controllers/quiz_api.py), returns the result as JSON."""
+        if 'user_id' not in session:
+            return quiz_api.error(401, "Log in first.")
+        user_id = session['user_id']
+        quiz = answer_keys.get(quiz_id)
+        if quiz is None:
+            return quiz_api.error(404, "No such quiz.")
+        if Score.query.filter_by(user_id=user_id, quiz_id=quiz_id).first():
+            return quiz_api.error(409, "You have already attempted this quiz.")
+        quiz = answer_keys.for_attempt(quiz, user_id)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return quiz_api.error(400, "Send a JSON object with 'version' and 'answers'.")
+        if data.get('version') != quiz_api.version_of(quiz):
+            return quiz_api.error(409, "The quiz has changed, load it again.")
+        try:
+            answers = quiz_api.answers_from_json(quiz, data)
+        except ValueError as e:
+            return quiz_api.error(400, str(e))
+        score = answer_keys.grade(quiz, answers)
+        status = score_writer.record_score(user_id, quiz.id, quiz.subject_id, score,
+                                           answers=answers, question_set=quiz.question_set,
+                                           question_ids=quiz.question_ids)
+        if status == score_writer.DUPLICATE:
+            return quiz_api.error(409, "You have already attempted this quiz.")
+        if status == score_writer.FAILED:
+            resp = quiz_api.error(503, "Your answers could not be saved yet, check your scores before submitting again.")
+            resp.headers['Retry-After'] = '5'
+            return resp
+        return quiz_api.result(quiz, score, leaderboard.standing(quiz.id, score))
+
     @app.route('/user/scores')
+    @read_only
+    @http_cache.conditional(scores_validators)
     def user_scores():
         if 'user_id' not in session:
             flash("Please log in first.", "warning")
             return redirect(url_for('login'))
         user_id = session.get('user_id')
-        scores = Score.query.filter_by(user_id=user_id).all()
-        return render_template('user_scores.html', scores=scores)
+        scores = paginate(
+            Score.query.options(loaders.score_quiz_chapter_subject()).filter_by(user_id=user_id), [Score.id]
+        )
+        standings = leaderboard.standings((s.quiz_id, s.total_scored) for s in scores)
+        return render_template('user_scores.html', scores=scores, standings=standings)
 
 
     @app.route('/user/summary') 
+    @read_only
     def user_summary():
         if 'user_id' not in session:
             flash("Please log in first.", "warning")
@@ -114,37 +192,27 @@ def User_routes(app):
             flash("Admins cannot access user summary.", "danger")
             return redirect(url_for('admin_dashboard'))
         user_id = session['user_id']
-        subjects = Subject.query.all()
-
-        # we are gettin the data from the tables
-        subject_names = []
-        total= []
-        for sub in subjects:
-            sum = 0
-            for chap in sub.chapters:
-                for quiz in chap.quizzes:
-                    for i in quiz.scores:
-                        if i.user_id == user_id:
-                            sum += i.total_scored
-            subject_names.append(sub.name)
-            total.append(sum)
-
-        # creating a bar graph
-        plt.clf()
-        fig, ax = plt.subplots(figsize=(6,4))
-        ax.bar(subject_names, total, color='purple')
-        ax.set_xlabel("Subjects")
-        ax.set_ylabel("Total Score")
-        ax.set_title("Scores per Subject")
-
-        user_chartpath = 'static/user_summary.png'
-        plt.savefig(user_chartpath)
-        plt.close(fig)
-
-        # Data for table 
+
+        # one lookup on the user_subject_scores rollup instead of walking every score
+        rows = reports.user_subject_totals(user_id)
+
+        # Data for table, the chart is served by user_summary_chart (linked by content hash)
         user_summary = []
-        for i, subj_name in enumerate(subject_names):
-            user_summary.append({'subject': subj_name,'score': total[i] })
+        for subj_name, points in rows:
+            user_summary.append({'subject': subj_name,'score': points })
 
-        return render_template('user_summary.html', user_chart_path=user_chartpath,user_summary_data=user_summary)
+        return render_template('user_summary.html', user_summary_data=user_summary,
+                               chart_version=charts.spec_key(scores_chart_spec(rows)))
+
+    @app.route('/user/summary/chart.png')
+    @read_only
+    def user_summary_chart():
+        if 'user_id' not in session:
+            flash("Please log in first.", "warning")
+            return redirect(url_for('login'))
+        if session.get('role') == 'Admin':
+            flash("Admins cannot access user summary.", "danger")
+            return redirect(url_for('admin_dashboard'))
 
+        rows = reports.user_subject_totals(session['user_id'])
+        return charts.chart_response(scores_chart_spec(rows))
@@ -0,0 +1,83 @@
+"""
+Query budget of the pages that load the subject/chapter/quiz hierarchy (controllers/loaders.py
+and the catalog snapshot). Every page is requested on a small and on a ten times larger
+database; the number of SQL statements it runs has to be the same on both.
+"""
+import pytest
+from sqlalchemy import event
+
+from main import create_app
+from controllers import migrations, seed, answer_keys
+from controllers.database import db
+from controllers.models import User, Subject, Quiz
+
+SIZES = {
+    'small': dict(users=5, subjects=2, chapters_per_subject=2, quizzes_per_chapter=2,
+                  questions_per_quiz=3, attempts_per_user=2),
+    'large': dict(users=50, subjects=20, chapters_per_subject=3, quizzes_per_chapter=3,
+                  questions_per_quiz=10, attempts_per_user=20),
+}
+
+# (name, role, path); 'fresh' is a student without attempts
+ROUTES = [
+    ('admin_dashboard', 'Admin', '/admin/dashboard'),
+    ('admin_quiz_overview', 'Admin', '/admin/quiz_overview'),
+    ('admin_chapters', 'Admin', '/admin/chapters/{subject}'),
+    ('admin_search', 'Admin', '/admin/search?q=seed'),
+    ('user_dashboard', 'Student', '/user/dashboard'),
+    ('user_scores', 'Student', '/user/scores'),
+    ('user_search', 'Student', '/user/search?q=seed'),
+    ('view_quiz', 'fresh', '/user/quiz/view/{quiz}'),
+    ('take_quiz', 'fresh', '/user/quiz/start/{quiz}'),
+]
+
+
+def statement_counts(tmp_path, volumes):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'budget.sqlite3'}",
+        'TESTING': True,
+        'ADMISSION_CONTROL': False,
+        'JINJA_BYTECODE_CACHE_DIR': str(tmp_path / 'jinja_cache'),
+    })
+    with app.app_context():
+        migrations.initialize('Admin123')
+        counts = seed.seed(random_seed=1, **volumes)
+        # the compiled answer keys are per process, not per database
+        answer_keys.invalidate_all()
+        fresh = User(username='fresh', password='x', full_name='Fresh Student')
+        db.session.add(fresh)
+        db.session.commit()
+        users = {
+            'Admin': User.query.filter_by(username='admin').one().id,
+            'Student': User.query.filter_by(username=f"seed_{counts['tag']}_0").one().id,
+            'fresh': fresh.id,
+        }
+        ids = {'subject': Subject.query.first().id, 'quiz': Quiz.query.first().id}
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(1))
+    result = {}
+    for name, who, path in ROUTES:
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = users[who]
+            sess['role'] = 'Admin' if who == 'Admin' else 'Student'
+        url = path.format(**ids)
+        # the first request may fill the per-process caches (catalog, answer keys)
+        client.get(url)
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200, (name, response.status_code)
+        result[name] = len(statements)
+    return result
+
+
+@pytest.fixture(scope='module')
+def budgets(tmp_path_factory):
+    return {size: statement_counts(tmp_path_factory.mktemp(size), volumes) for size, volumes in SIZES.items()}
+
+
+@pytest.mark.parametrize('route', [name for name, _, _ in ROUTES])
+def test_statement_count_does_not_grow_with_data(budgets, route):
+    assert budgets['large'][route] == budgets['small'][route]
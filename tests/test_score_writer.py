@@ -0,0 +1,92 @@
+"""
+The write-behind score writer (SCORE_WRITE_BEHIND) only acknowledges attempts that are
+committed: a batch whose commit fails is FAILED for every submitter waiting on it.
+"""
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from main import create_app
+from controllers import migrations, score_writer
+from controllers.database import db
+from controllers.models import User, Subject, Chapter, Quiz, Score
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'scores.sqlite3'}",
+        'TESTING': True,
+        'ADMISSION_CONTROL': False,
+        'SCORE_WRITE_BEHIND': True,
+        'SCORE_FLUSH_INTERVAL_MS': 10,
+        'JINJA_BYTECODE_CACHE_DIR': str(tmp_path / 'jinja_cache'),
+    })
+    with app.app_context():
+        migrations.initialize('Admin123')
+        subject = Subject(name='Math')
+        db.session.add(subject)
+        db.session.flush()
+        chapter = Chapter(name='Algebra', subject_id=subject.id)
+        db.session.add(chapter)
+        db.session.flush()
+        quiz = Quiz(chapter_id=chapter.id, date_of_quiz=datetime(2030, 1, 1), time_duration='00:10')
+        user = User(username='student', password='x', full_name='Student')
+        db.session.add_all([quiz, user])
+        db.session.commit()
+        app.config['TEST_IDS'] = (user.id, quiz.id, subject.id)
+    yield app
+    writer = app.extensions.get('score_writer')
+    if writer is not None:
+        writer.stop()
+
+
+def record(app, results=None):
+    user_id, quiz_id, subject_id = app.config['TEST_IDS']
+    with app.app_context():
+        status = score_writer.record_score(user_id, quiz_id, subject_id, 3)
+    if results is not None:
+        results.append(status)
+    return status
+
+
+def score_count(app):
+    with app.app_context():
+        return Score.query.count()
+
+
+def failing_commit(delay=0.0):
+    def commit(self):
+        time.sleep(delay)
+        raise OperationalError('COMMIT', {}, Exception('database is locked'))
+    return commit
+
+
+def test_saved_once_committed(app):
+    assert record(app) == score_writer.SAVED
+    assert record(app) == score_writer.DUPLICATE
+    assert score_count(app) == 1
+
+
+def test_failed_commit_is_not_acknowledged(app, monkeypatch):
+    monkeypatch.setattr(Session, 'commit', failing_commit())
+    assert record(app) == score_writer.FAILED
+    monkeypatch.undo()
+    assert score_count(app) == 0
+
+
+def test_second_submit_waits_for_the_first(app, monkeypatch):
+    monkeypatch.setattr(Session, 'commit', failing_commit(delay=0.1))
+    results = []
+    first = threading.Thread(target=record, args=(app, results))
+    first.start()
+    time.sleep(0.05)  # the first attempt is now being written
+    record(app, results)
+    first.join()
+    monkeypatch.undo()
+    assert results == [score_writer.FAILED, score_writer.FAILED]
+    assert score_count(app) == 0